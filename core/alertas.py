@@ -0,0 +1,89 @@
+from collections import deque
+
+NORMAL = 'normal'
+ELEVADO = 'elevado'
+MAXIMO = 'maximo'
+
+# Tope de la ventana de elevación sostenida (segundos)
+VENTANA_MAXIMA = 600
+
+
+class MotorAlertas:
+    """
+    Evalúa cada muestra de frecuencia cardíaca contra los umbrales del paciente en O(1) amortizado.
+
+    - MAXIMO: la muestra alcanza bpm_maximo; se sale al bajar HISTERESIS_MAXIMO bpm por debajo.
+    - ELEVADO: al menos PROPORCION_ENTRADA de las muestras de los últimos segundos_elevacion
+      segundos está sobre el reposo más el margen; se sale cuando la proporción baja de
+      PROPORCION_SALIDA. Ambos cambios exigen que las muestras cubran la ventana completa.
+
+    La ventana se mide con la marca de tiempo de las muestras y no con su cantidad, porque
+    cada sensor notifica a su propio ritmo (1 Hz, 4 Hz...). Un hueco mayor a brecha_maxima
+    segundos (el sensor se desconectó) la vacía. Solo se informa el estado cuando cambia.
+    """
+    PROPORCION_ENTRADA = 0.8
+    PROPORCION_SALIDA = 0.2
+    HISTERESIS_MAXIMO = 5
+
+    def __init__(self, umbrales, brecha_maxima=5.0):
+        self.bpm_elevado = umbrales.bpm_elevado
+        self.bpm_maximo = umbrales.bpm_maximo
+        self.segundos = max(1, min(umbrales.segundos_elevacion, VENTANA_MAXIMA))
+        self.brecha_maxima = brecha_maxima
+        # (segundos desde la primera muestra, 1 si estaba elevada) en orden de llegada
+        self.ventana = deque()
+        self.elevadas = 0
+        self.origen = None
+        self.desde = None
+        self.elevacion_sostenida = False
+        self.sobre_maximo = False
+        self.estado = NORMAL
+
+    def evaluar(self, momento, bpm):
+        """Procesa una muestra tomada en `momento`; devuelve el nuevo estado si cambió, si no None."""
+        if self.origen is None:
+            self.origen = momento
+        # Segundos relativos a la primera muestra: timedelta es exacto, las marcas absolutas no
+        t = (momento - self.origen).total_seconds()
+        self.agregar(t, 1 if bpm >= self.bpm_elevado else 0)
+
+        if self.sobre_maximo:
+            self.sobre_maximo = bpm > self.bpm_maximo - self.HISTERESIS_MAXIMO
+        else:
+            self.sobre_maximo = bpm >= self.bpm_maximo
+
+        cantidad = len(self.ventana)
+        if self.ventana[-1][0] - self.desde >= self.segundos:
+            if self.elevacion_sostenida:
+                self.elevacion_sostenida = self.elevadas > cantidad * self.PROPORCION_SALIDA
+            else:
+                self.elevacion_sostenida = self.elevadas >= cantidad * self.PROPORCION_ENTRADA
+
+        if self.sobre_maximo:
+            estado = MAXIMO
+        elif self.elevacion_sostenida:
+            estado = ELEVADO
+        else:
+            estado = NORMAL
+
+        if estado == self.estado:
+            return None
+        self.estado = estado
+        return estado
+
+    def agregar(self, t, elevada):
+        if self.ventana:
+            ultima = self.ventana[-1][0]
+            if t < ultima:
+                # Muestra atrasada: cuenta para el máximo, no para la ventana
+                return
+            if t - ultima > self.brecha_maxima:
+                self.ventana.clear()
+                self.elevadas = 0
+        if not self.ventana:
+            self.desde = t
+
+        self.ventana.append((t, elevada))
+        self.elevadas += elevada
+        while self.ventana[0][0] <= t - self.segundos:
+            self.elevadas -= self.ventana.popleft()[1]
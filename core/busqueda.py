@@ -0,0 +1,74 @@
+import re
+
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import Usuario
+from .rut import normalizar_rut
+
+# Texto que puede ser el comienzo de un RUT: dígitos y, al final, quizás el dígito verificador
+PATRON_RUT_PARCIAL = re.compile(r'\d+K?')
+LARGO_MINIMO = 2
+
+
+#---------------------------Búsqueda de usuarios por RUT, nombre o email---------------------------------
+def buscar_usuarios(texto, limite=10, usuarios=None):
+    """
+    Primero los usuarios cuyo RUT normalizado comienza con el texto (índice de rut_normalizado),
+    luego coincidencias aproximadas por RUT, nombre, apellido o email: similitud trigram en
+    PostgreSQL (índices GIN de pg_trgm) y icontains en otros motores.
+    """
+    texto = texto.strip()
+    if len(texto) < LARGO_MINIMO:
+        return []
+    usuarios = (Usuario.objects.all() if usuarios is None else usuarios).only(
+        'id', 'rut', 'first_name', 'last_name', 'email'
+    )
+
+    encontrados = []
+    rut = normalizar_rut(texto)
+    if PATRON_RUT_PARCIAL.fullmatch(rut):
+        encontrados = list(usuarios.filter(rut_normalizado__startswith=rut).order_by('rut_normalizado')[:limite])
+
+    if len(encontrados) < limite:
+        vistos = [usuario.id for usuario in encontrados]
+        aproximados = buscar_aproximado(usuarios.exclude(id__in=vistos), texto, rut)
+        encontrados += list(aproximados[:limite - len(encontrados)])
+
+    return [como_resultado(usuario) for usuario in encontrados]
+
+
+def buscar_aproximado(usuarios, texto, rut):
+    if connection.vendor == 'postgresql':
+        # Import diferido: django.contrib.postgres requiere psycopg
+        from django.contrib.postgres.lookups import TrigramSimilar
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        # TrigramSimilar es el operador %, el que pueden resolver los índices GIN trigram; el umbral
+        # es pg_trgm.similarity_threshold (0.3 por defecto)
+        return usuarios.filter(
+            TrigramSimilar(F('rut_normalizado'), rut)
+            | TrigramSimilar(F('first_name'), texto)
+            | TrigramSimilar(F('last_name'), texto)
+            | TrigramSimilar(F('email'), texto)
+        ).annotate(similitud=Greatest(
+            TrigramSimilarity('rut_normalizado', rut),
+            TrigramSimilarity('first_name', texto),
+            TrigramSimilarity('last_name', texto),
+            TrigramSimilarity('email', texto),
+        )).order_by('-similitud', 'id')
+
+    condicion = Q(first_name__icontains=texto) | Q(last_name__icontains=texto) | Q(email__icontains=texto)
+    if rut:
+        condicion |= Q(rut_normalizado__icontains=rut)
+    return usuarios.filter(condicion).order_by('last_name', 'first_name', 'id')
+
+
+def como_resultado(usuario):
+    return {
+        'id': usuario.id,
+        'rut': usuario.rut,
+        'nombre': f"{usuario.first_name} {usuario.last_name}".strip(),
+        'email': usuario.email,
+    }
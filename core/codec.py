@@ -0,0 +1,48 @@
+# Codificación de los mensajes del WebSocket. Usa orjson si está instalado (varias veces más
+# rápido que json) y msgpack para el subprotocolo binario opcional.
+import json
+
+import msgpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Subprotocolo que el cliente puede pedir en Sec-WebSocket-Protocol para recibir tramas binarias
+SUBPROTOCOLO_BINARIO = 'inmersion.msgpack'
+
+
+class ErrorDecodificacion(ValueError):
+    pass
+
+
+if orjson is not None:
+    def a_json(datos):
+        return orjson.dumps(datos).decode()
+
+    def desde_json(texto):
+        return orjson.loads(texto)
+else:
+    def a_json(datos):
+        return json.dumps(datos)
+
+    def desde_json(texto):
+        return json.loads(texto)
+
+
+def a_msgpack(datos):
+    return msgpack.packb(datos, use_bin_type=True)
+
+
+def decodificar(text_data=None, bytes_data=None):
+    try:
+        if bytes_data is not None:
+            datos = msgpack.unpackb(bytes_data, raw=False)
+        else:
+            datos = desde_json(text_data)
+    except Exception as e:
+        raise ErrorDecodificacion(str(e)) from e
+    if not isinstance(datos, dict):
+        raise ErrorDecodificacion(f"Se esperaba un objeto y se recibió {type(datos).__name__}.")
+    return datos
@@ -0,0 +1,46 @@
+from time import monotonic
+
+from django.conf import settings
+
+#---------------------------Conexiones WebSocket de este proceso---------------------------------
+# Registro en memoria de los consumidores abiertos en el worker, para medir cuántos miembros de
+# los grupos room_<id> siguen respondiendo. Cada worker (daphne) lleva su propia cuenta.
+_activas = {}  # channel_name -> consumidor
+_cerradas_por_inactividad = 0
+
+
+def registrar(consumidor):
+    _activas[consumidor.channel_name] = consumidor
+
+
+def retirar(consumidor):
+    _activas.pop(consumidor.channel_name, None)
+
+
+def registrar_cierre_por_inactividad():
+    global _cerradas_por_inactividad
+    _cerradas_por_inactividad += 1
+
+
+def metricas(ahora=None):
+    """
+    Conexiones vivas (con actividad dentro de un intervalo de ping, más un margen) frente a
+    inactivas (no contestaron el último ping y serán cerradas si siguen sin responder).
+    """
+    ahora = monotonic() if ahora is None else ahora
+    limite = getattr(settings, 'WS_INTERVALO_PING', 20) * 1.5
+    vivas = inactivas = 0
+    salas = set()
+    for consumidor in list(_activas.values()):
+        salas.add(consumidor.room_id)
+        if ahora - consumidor.ultima_actividad <= limite:
+            vivas += 1
+        else:
+            inactivas += 1
+    return {
+        'conexiones': vivas + inactivas,
+        'vivas': vivas,
+        'inactivas': inactivas,
+        'salas': len(salas),
+        'cerradas_por_inactividad': _cerradas_por_inactividad,
+    }
@@ -1,30 +1,133 @@
 # consumers.py
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from time import monotonic
+import asyncio
+import logging
+
+from . import codec, conexiones, estado_sala, permisos_sala, presencia
+from .escritura import BufferEscritura
+from .alertas import MotorAlertas
+from .limites import CoalescedorAcciones, CubetaTokens
+from .pulso import SuavizadorPulso
+from .models import Mensaje, SignosVitalesBloque, UmbralesPaciente, UsuarioSesion
+
+logger = logging.getLogger(__name__)
+
+BPM_MINIMO = 20
+BPM_MAXIMO = 250
+# Ventana aceptada para la marca de tiempo de una muestra respecto de la hora del servidor
+ANTIGUEDAD_MAXIMA_MUESTRA = timedelta(hours=24)
+ADELANTO_MAXIMO_MUESTRA = timedelta(minutes=5)
+# Sesión de signos vitales todavía no buscada; None significa que se buscó y no hay
+SESION_SIN_RESOLVER = object()
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.room_id = self.scope['url_route']['kwargs']['room_id']
+        self.room_id = int(self.scope['url_route']['kwargs']['room_id'])
         self.room_group_name = f"room_{self.room_id}"
+        self.autorizado = False
+
+        # Solo el terapeuta y el paciente de la sala pueden conectarse
+        usuario = self.scope.get('user')
+        miembros = await permisos_sala.miembros_sala(self.room_id)
+        if usuario is None or not usuario.is_authenticated or miembros is None or usuario.pk not in miembros:
+            await self.close(code=4403)
+            return
+        self.autorizado = True
+        self.es_terapeuta = usuario.pk == miembros[0]
+        # Subprotocolo binario opcional (msgpack) pedido por el cliente al conectarse
+        self.binario = codec.SUBPROTOCOLO_BINARIO in self.scope.get('subprotocols', [])
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        # Buffer de signos vitales de esta conexión; se crea al llegar la primera muestra
+        self.buffer_vitales = None
+        self.sesion_vitales_id = SESION_SIN_RESOLVER
+        # Pulso suavizado que se reenvía al terapeuta a una tasa fija
+        self.suavizador = SuavizadorPulso(
+            tamano=getattr(settings, 'VITALES_VENTANA_SUAVIZADO', 8),
+            salto_maximo=getattr(settings, 'VITALES_SALTO_MAXIMO', 30),
+        )
+        self.ultimo_relevo = 0.0
+        # Alertas de frecuencia cardíaca; los umbrales se leen una vez, con la primera muestra
+        self.motor_alertas = None
 
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
+        # Los mensajes se persisten por lotes en segundo plano, fuera del camino del group_send
+        self.buffer_mensajes = BufferEscritura(
+            guardar_mensajes,
+            tamano_maximo=getattr(settings, 'MENSAJES_LOTE_MAXIMO', 50),
+            intervalo=getattr(settings, 'MENSAJES_INTERVALO_VACIADO', 1.0),
+        )
+        self.buffer_mensajes.iniciar()
+
+        # Límite de acciones de video por conexión y agrupación de ráfagas de seek/play/pause
+        self.cubeta = CubetaTokens(
+            tasa=getattr(settings, 'WS_TASA_MENSAJES', 10),
+            capacidad=getattr(settings, 'WS_RAFAGA_MENSAJES', 20),
+        )
+        self.descartados = 0
+        self.coalescedor = CoalescedorAcciones(
+            self.publicar_accion, ventana=getattr(settings, 'VIDEO_VENTANA_COALESCENCIA', 0.15)
         )
 
-    async def receive(self, text_data):
-        print(f"Mensaje recibido en el servidor: {text_data}")
+        await self.accept(subprotocol=codec.SUBPROTOCOLO_BINARIO if self.binario else None)
+
+        # Ping periódico: las conexiones que dejan de responder se cierran y salen del grupo
+        # antes de que lo haga la expiración de grupos de la capa de canales
+        self.ultima_actividad = monotonic()
+        conexiones.registrar(self)
+        self.tarea_latido = asyncio.ensure_future(self.latido())
+        self.en_sala = True
+        await self.anunciar_presencia(True)
+
+        # Últimos mensajes de la sala; los anteriores se piden por HTTP con el cursor 'siguiente'
+        historial = await database_sync_to_async(Mensaje.objects.pagina)(
+            self.room_id, getattr(settings, 'HISTORIAL_MENSAJES_CONEXION', 50)
+        )
+        await self.enviar(historial)
+
+        # Instantánea del video para sincronizar a quien llega tarde, sin reproducir eventos pasados
+        estado = await estado_sala.obtener_estado(self.room_id)
+        if estado is not None:
+            await self.enviar({'estado': estado_sala.instantanea(estado)})
+
+    async def disconnect(self, close_code):
+        if not self.autorizado:
+            return
+
+        self.tarea_latido.cancel()
+        await self.salir_de_sala()
+
+        # Lo que quedó pendiente en la ventana se publica para no perder el estado final
+        await self.coalescedor.cerrar()
+        await self.buffer_mensajes.cerrar()
+        if self.buffer_vitales is not None:
+            await self.buffer_vitales.cerrar()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Cualquier trama, incluido el pong, cuenta como señal de vida
+        self.ultima_actividad = monotonic()
 
         try:
-            text_data_json = json.loads(text_data)
+            text_data_json = codec.decodificar(text_data, bytes_data)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                tipo = tipo_mensaje(text_data_json)
+                logger.debug(
+                    "mensaje_recibido sala=%s tipo=%s bytes=%d", self.room_id, tipo, len(text_data or bytes_data),
+                    extra={'sala': self.room_id, 'tipo': tipo},
+                )
+
+            if 'pong' in text_data_json:
+                return
 
             if 'action' in text_data_json:
                 action = text_data_json['action']
@@ -36,14 +139,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 if action == 'seek' and (time is None or not isinstance(time, (int, float))):
                     raise ValueError(f"Tiempo inválido para la acción 'seek': {time}")
 
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'video_action',
-                        'action': action,
-                        'time': time
-                    }
-                )
+                if self.admitir_accion():
+                    await self.coalescedor.agregar(action, time)
 
             elif 'message' in text_data_json:
                 message = text_data_json['message']
@@ -52,31 +149,280 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     self.room_group_name,
                     {
                         'type': 'chat_message',
-                        'message': message
+                        'texto': codec.a_json({'message': message}),
                     }
                 )
+                self.registrar_mensaje(tipo=1, contenido=str(message))
+                await estado_sala.registrar_mensaje(self.room_id, str(message))
+
+            elif 'vitals' in text_data_json:
+                await self.recibir_vitales(text_data_json)
             else:
-                raise ValueError("Mensaje recibido sin 'action' o 'message'.")
+                raise ValueError("Mensaje recibido sin 'action', 'message' o 'vitals'.")
 
-        except ValueError as e:
-            print(f"Error de validación: {e}")
-        except json.JSONDecodeError as e:
-            print(f"Error al decodificar JSON: {e}")
+        except codec.ErrorDecodificacion as e:
+            # Va antes que ValueError, de la que es subclase
+            logger.warning("trama_invalida sala=%s error=%s", self.room_id, e)
             await self.close()
-        except Exception as e:
-            print(f"Error inesperado: {e}")
+        except ValueError as e:
+            logger.warning("mensaje_invalido sala=%s error=%s", self.room_id, e)
+        except Exception:
+            logger.exception("error_inesperado sala=%s", self.room_id)
             await self.close()
 
+    def admitir_accion(self):
+        # Solo se limitan las acciones de video: el chat y los signos vitales no se pierden.
+        # Del exceso solo se registra el primer descarte de cada racha
+        if not self.cubeta.consumir():
+            self.descartados += 1
+            if self.descartados == 1:
+                logger.warning("limite_mensajes_excedido sala=%s", self.room_id)
+            return False
+        if self.descartados:
+            logger.info("limite_mensajes_recuperado sala=%s descartados=%d", self.room_id, self.descartados)
+            self.descartados = 0
+        return True
+
+    async def latido(self):
+        intervalo = getattr(settings, 'WS_INTERVALO_PING', 20)
+        tiempo_maximo = getattr(settings, 'WS_TIEMPO_INACTIVIDAD', 60)
+        while True:
+            await asyncio.sleep(intervalo)
+            inactivo = monotonic() - self.ultima_actividad
+            if inactivo > tiempo_maximo:
+                logger.info("conexion_inactiva_cerrada sala=%s segundos=%.0f", self.room_id, inactivo)
+                conexiones.registrar_cierre_por_inactividad()
+                await self.close(code=4408)
+                # El servidor no siempre avisa el cierre al consumidor; se sale del grupo aquí mismo
+                await self.salir_de_sala()
+                return
+            if inactivo <= intervalo * 1.5:
+                # Solo las conexiones que contestaron el último ping renuevan su presencia
+                await presencia.marcar_conectado(self.room_id, self.scope['user'].pk, self.channel_name)
+            await self.enviar({'ping': int(timezone.now().timestamp() * 1000)})
+
+    async def salir_de_sala(self):
+        if not self.en_sala:
+            return
+        self.en_sala = False
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        conexiones.retirar(self)
+        await self.anunciar_presencia(False)
+
+    async def anunciar_presencia(self, conectado):
+        usuario_id = self.scope['user'].pk
+        if conectado:
+            await presencia.marcar_conectado(self.room_id, usuario_id, self.channel_name)
+        elif not await presencia.marcar_desconectado(self.room_id, usuario_id, self.channel_name):
+            # Otra conexión más reciente del mismo usuario tiene la presencia: sigue conectado
+            return
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'presencia',
+                'usuario': usuario_id,
+                'conectado': conectado,
+                'texto': codec.a_json({'presencia': {'usuario': usuario_id, 'conectado': conectado}}),
+            }
+        )
+
+    async def publicar_accion(self, action, time):
+        await self.difundir('video_action', {'action': action, 'time': time})
+        self.registrar_mensaje(
+            tipo=2,
+            accion=action,
+            tiempo=time if isinstance(time, (int, float)) and not isinstance(time, bool) else None,
+        )
+        await estado_sala.registrar_accion(self.room_id, action, time)
+
+    def registrar_mensaje(self, **campos):
+        usuario = self.scope.get('user')
+        self.buffer_mensajes.agregar([Mensaje(
+            room_id=self.room_id,
+            autor_id=usuario.pk if usuario is not None and usuario.is_authenticated else None,
+            fecha_envio=timezone.now(),
+            **campos
+        )])
+
+    async def recibir_vitales(self, data):
+        usuario = self.scope.get('user')
+        if usuario is None or not usuario.is_authenticated:
+            raise ValueError("Signos vitales recibidos de un usuario no autenticado.")
+
+        muestras = parsear_muestras(data['vitals'])
+        if not self.es_terapeuta:
+            if self.motor_alertas is None:
+                umbrales = await database_sync_to_async(UmbralesPaciente.objects.para_paciente)(usuario.pk)
+                self.motor_alertas = MotorAlertas(umbrales, getattr(settings, 'VITALES_BRECHA_MAXIMA', 5.0))
+            await self.procesar_pulso(muestras)
+
+        # Se busca una sola vez por conexión, también cuando no existe: sin sesión las muestras
+        # no se guardan, pero no se vuelve a consultar la base de datos con cada trama
+        if self.sesion_vitales_id is SESION_SIN_RESOLVER:
+            # Una sesión inválida también se recuerda como "sin sesión" antes de informar el error
+            self.sesion_vitales_id = None
+            sesion_id = parsear_sesion(data.get('sesion'))
+            self.sesion_vitales_id = await resolver_sesion(usuario, sesion_id)
+            if self.sesion_vitales_id is None:
+                raise ValueError(f"El usuario {usuario.pk} no tiene una sesión de terapia para registrar signos vitales.")
+        if self.sesion_vitales_id is None:
+            return
+
+        if self.buffer_vitales is None:
+            self.buffer_vitales = BufferEscritura(
+                partial(guardar_signos_vitales, usuario.pk, self.sesion_vitales_id),
+                tamano_maximo=getattr(settings, 'VITALES_LOTE_MAXIMO', 200),
+                intervalo=getattr(settings, 'VITALES_INTERVALO_VACIADO', 2.0),
+            )
+            self.buffer_vitales.iniciar()
+
+        self.buffer_vitales.agregar(muestras)
+
+    async def procesar_pulso(self, muestras):
+        # Sin consultas a la base de datos: suavizado, alertas y reenvío trabajan en memoria
+        aceptadas = 0
+        for momento, bpm in muestras:
+            if not self.suavizador.agregar(bpm):
+                continue
+            aceptadas += 1
+            estado = self.motor_alertas.evaluar(momento, bpm)
+            if estado is not None:
+                await self.difundir('alerta', {'alerta': {
+                    'estado': estado, 'bpm': bpm, 't': int(momento.timestamp() * 1000),
+                }})
+        if not aceptadas:
+            return
+
+        # Una muestra por intervalo, sin importar cada cuánto notifique el sensor
+        ahora = monotonic()
+        if ahora - self.ultimo_relevo < getattr(settings, 'VITALES_INTERVALO_RELEVO', 1.0):
+            return
+        self.ultimo_relevo = ahora
+
+        momento = muestras[-1][0]
+        await self.difundir('vitales', {'pulso': {
+            'bpm': round(self.suavizador.media), 't': int(momento.timestamp() * 1000),
+        }})
+
+    async def difundir(self, tipo, payload):
+        # Se codifica una sola vez, en JSON, que es lo que usan los clientes del navegador; solo
+        # quien negoció el subprotocolo binario lo vuelve a empaquetar al recibirlo (ver reenviar)
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': tipo,
+                'texto': codec.a_json(payload),
+            }
+        )
+
+    async def enviar(self, datos):
+        # Para envíos a una sola conexión; los eventos de grupo llegan ya codificados
+        if self.binario:
+            await self.send(bytes_data=codec.a_msgpack(datos))
+        else:
+            await self.send(text_data=codec.a_json(datos))
+
+    async def reenviar(self, event, empaquetar=False):
+        # Las tramas binarias solo se usan en los eventos de alta frecuencia (empaquetar=True)
+        if self.binario and empaquetar:
+            await self.send(bytes_data=codec.a_msgpack(codec.desde_json(event['texto'])))
+        else:
+            await self.send(text_data=event['texto'])
+
     async def chat_message(self, event):
-        message = event['message']
-        await self.send(text_data=json.dumps({
-            'message': message
-        }))
+        await self.reenviar(event)
 
     async def video_action(self, event):
-        action = event['action']
-        time = event.get('time', None)
-        await self.send(text_data=json.dumps({
-            'action': action,
-            'time': time
-        }))
+        await self.reenviar(event, empaquetar=True)
+
+    async def presencia(self, event):
+        await self.reenviar(event)
+        # Se cerró la conexión dueña de la presencia, pero el usuario sigue en esta: la reclama
+        if not event.get('conectado', True) and event.get('usuario') == self.scope['user'].pk and self.en_sala:
+            await self.anunciar_presencia(True)
+
+    async def vitales(self, event):
+        # El pulso solo se muestra al terapeuta; el paciente ya lo ve en su propio dispositivo
+        if self.es_terapeuta:
+            await self.reenviar(event, empaquetar=True)
+
+    async def alerta(self, event):
+        if self.es_terapeuta:
+            await self.reenviar(event, empaquetar=True)
+
+
+def tipo_mensaje(data):
+    if 'action' in data:
+        return data['action']
+    for tipo in ('message', 'vitals'):
+        if tipo in data:
+            return tipo
+    return 'desconocido'
+
+
+#--------------------------------------Mensajes---------------------------------------------------------
+def guardar_mensajes(lote):
+    Mensaje.objects.bulk_create(lote)
+
+
+#--------------------------------------Signos vitales---------------------------------------------------
+def parsear_muestras(vitals):
+    """
+    Acepta una muestra o una lista de muestras. Cada muestra puede ser un número (bpm)
+    o un objeto {"bpm": 72, "t": <epoch en ms>}. Devuelve una lista de (datetime, bpm).
+    """
+    if not isinstance(vitals, list):
+        vitals = [vitals]
+
+    ahora = timezone.now()
+    muestras = []
+    for muestra in vitals:
+        t = None
+        if isinstance(muestra, dict):
+            bpm = muestra.get('bpm')
+            t = muestra.get('t')
+        else:
+            bpm = muestra
+
+        if isinstance(bpm, bool) or not isinstance(bpm, int) or not BPM_MINIMO <= bpm <= BPM_MAXIMO:
+            raise ValueError(f"Frecuencia cardíaca inválida: {bpm}")
+
+        if t is None:
+            momento = ahora
+        elif isinstance(t, (int, float)) and not isinstance(t, bool):
+            try:
+                momento = datetime.fromtimestamp(t / 1000, tz=dt_timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                raise ValueError(f"Marca de tiempo inválida: {t}") from None
+            if not ahora - ANTIGUEDAD_MAXIMA_MUESTRA <= momento <= ahora + ADELANTO_MAXIMO_MUESTRA:
+                raise ValueError(f"Marca de tiempo fuera de rango: {t}")
+        else:
+            raise ValueError(f"Marca de tiempo inválida: {t}")
+
+        muestras.append((momento, bpm))
+    return muestras
+
+
+def parsear_sesion(sesion):
+    """Id de sesión opcional enviado por el cliente; None si no viene."""
+    if sesion is None:
+        return None
+    if isinstance(sesion, bool):
+        raise ValueError(f"Sesión inválida: {sesion}")
+    try:
+        return int(sesion)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"Sesión inválida: {sesion}") from None
+
+
+@database_sync_to_async
+def resolver_sesion(usuario, sesion_id=None):
+    # Si el cliente no indica la sesión se usa la más reciente del usuario
+    participaciones = UsuarioSesion.objects.filter(usuario=usuario)
+    if sesion_id is not None:
+        participaciones = participaciones.filter(sesion_id=sesion_id)
+    return participaciones.order_by('-sesion__fecha_sesion').values_list('sesion_id', flat=True).first()
+
+
+def guardar_signos_vitales(usuario_id, sesion_id, lote):
+    SignosVitalesBloque.objects.agregar_muestras(usuario_id, sesion_id, lote)
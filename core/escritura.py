@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+class BufferEscritura:
+    """
+    Acumula elementos en memoria y los persiste por lotes en un hilo aparte,
+    para no bloquear el event loop ni hacer un INSERT por elemento.
+
+    El lote se vacía cuando alcanza `tamano_maximo` elementos o cada
+    `intervalo` segundos, lo que ocurra primero. `persistir` es una función
+    síncrona que recibe la lista de elementos del lote.
+    """
+
+    def __init__(self, persistir, tamano_maximo=200, intervalo=2.0):
+        self.persistir = persistir
+        self.tamano_maximo = tamano_maximo
+        self.intervalo = intervalo
+        self._pendientes = []
+        self._lock = asyncio.Lock()
+        self._tarea_periodica = None
+        self._vaciados = set()
+
+    def iniciar(self):
+        if self._tarea_periodica is None:
+            self._tarea_periodica = asyncio.ensure_future(self._vaciar_periodicamente())
+
+    def agregar(self, elementos):
+        self._pendientes.extend(elementos)
+        if len(self._pendientes) >= self.tamano_maximo:
+            # No se espera la escritura: quien recibe el mensaje sigue atendiendo el socket
+            tarea = asyncio.ensure_future(self.vaciar())
+            self._vaciados.add(tarea)
+            tarea.add_done_callback(self._vaciados.discard)
+
+    async def vaciar(self):
+        async with self._lock:
+            if not self._pendientes:
+                return
+            lote, self._pendientes = self._pendientes, []
+            try:
+                await database_sync_to_async(self.persistir)(lote)
+            except Exception:
+                logger.exception("error_persistiendo_lote elementos=%d", len(lote))
+
+    async def cerrar(self):
+        if self._tarea_periodica is not None:
+            self._tarea_periodica.cancel()
+            self._tarea_periodica = None
+        if self._vaciados:
+            await asyncio.gather(*self._vaciados, return_exceptions=True)
+        await self.vaciar()
+
+    async def _vaciar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self.vaciar()
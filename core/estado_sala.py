@@ -0,0 +1,69 @@
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Mismo patrón que extractVideoId en chat.js
+PATRON_YOUTUBE = re.compile(r'(?:https?://(?:www\.)?youtube\.com/watch\?v=|youtu\.be/)([a-zA-Z0-9_-]{11})')
+
+
+#---------------------------Estado de reproducción de cada sala---------------------------------
+# Se guarda en la caché (Redis si REDIS_URL está definido, si no memoria local) para que
+# quien se conecte tarde reciba una sola instantánea en vez de reproducir todos los eventos.
+def clave_estado(room_id):
+    return f"sala:{room_id}:estado"
+
+
+def posicion_actual(estado, ahora=None):
+    if not estado.get('reproduciendo'):
+        return estado.get('posicion', 0)
+    ahora = time.time() if ahora is None else ahora
+    return estado.get('posicion', 0) + max(ahora - estado['actualizado'], 0)
+
+
+def instantanea(estado):
+    """Estado listo para enviar al cliente, con la posición proyectada al momento actual."""
+    return {
+        'video_id': estado.get('video_id'),
+        'posicion': round(posicion_actual(estado), 2),
+        'reproduciendo': estado.get('reproduciendo', False),
+    }
+
+
+def estado_video(mensaje):
+    coincidencia = PATRON_YOUTUBE.search(mensaje)
+    if not coincidencia:
+        return None
+    # El cliente reproduce automáticamente el video al cargarlo
+    return {'video_id': coincidencia.group(1), 'posicion': 0, 'reproduciendo': True, 'actualizado': time.time()}
+
+
+def aplicar_accion(estado, accion, tiempo):
+    ahora = time.time()
+    nuevo = dict(estado or {})
+    if isinstance(tiempo, (int, float)) and not isinstance(tiempo, bool):
+        nuevo['posicion'] = float(tiempo)
+    else:
+        nuevo['posicion'] = posicion_actual(nuevo, ahora) if nuevo else 0
+    if accion == 'play':
+        nuevo['reproduciendo'] = True
+    elif accion == 'pause':
+        nuevo['reproduciendo'] = False
+    nuevo['actualizado'] = ahora
+    return nuevo
+
+
+async def obtener_estado(room_id):
+    return await cache.aget(clave_estado(room_id))
+
+
+async def registrar_mensaje(room_id, mensaje):
+    estado = estado_video(mensaje)
+    if estado is not None:
+        await cache.aset(clave_estado(room_id), estado, settings.ESTADO_SALA_TTL)
+
+
+async def registrar_accion(room_id, accion, tiempo):
+    estado = aplicar_accion(await obtener_estado(room_id), accion, tiempo)
+    await cache.aset(clave_estado(room_id), estado, settings.ESTADO_SALA_TTL)
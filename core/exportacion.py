@@ -0,0 +1,83 @@
+import csv
+import zlib
+from datetime import timedelta
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .models import desempaquetar_muestras
+
+ENCABEZADO_SIGNOS_VITALES = ['rut', 'sesion', 'fecha_sesion', 'fecha', 'bpm']
+# Se acumulan filas hasta este tamaño antes de entregar una parte de la respuesta
+TAMANO_PARTE = 64 * 1024
+# Bloques (un minuto de muestras cada uno) que se traen de la base de datos por viaje
+BLOQUES_POR_LECTURA = 2000
+
+
+#--------------------------------Exportación de signos vitales en CSV--------------------------------
+class Eco:
+    """Archivo falso para csv.writer: write() devuelve la línea en vez de guardarla."""
+    def write(self, valor):
+        return valor
+
+
+def filas_signos_vitales(bloques):
+    """Una fila por muestra, leyendo los bloques con un cursor del servidor y sin instanciar modelos."""
+    valores = bloques.order_by('sesion_id', 'usuario_id', 'minuto').values_list(
+        'usuario__rut', 'sesion_id', 'sesion__fecha_sesion', 'minuto', 'n_muestras', 'datos'
+    )
+    for rut, sesion_id, fecha_sesion, minuto, n_muestras, datos in valores.iterator(chunk_size=BLOQUES_POR_LECTURA):
+        fecha_sesion = fecha_sesion.isoformat()
+        for offset, bpm in desempaquetar_muestras(datos, n_muestras):
+            yield rut, sesion_id, fecha_sesion, (minuto + timedelta(milliseconds=offset)).isoformat(), bpm
+
+
+def partes_csv(filas, encabezado, comprimir=False):
+    """Genera el CSV en partes de ~TAMANO_PARTE bytes, comprimidas con gzip si se pide."""
+    escritor = csv.writer(Eco())
+    compresor = zlib.compressobj(wbits=31) if comprimir else None  # wbits=31: formato gzip
+    lineas = []
+    tamano = 0
+    for fila in chain([encabezado], filas):
+        linea = escritor.writerow(fila)
+        lineas.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_PARTE:
+            parte = ''.join(lineas).encode()
+            lineas, tamano = [], 0
+            if compresor is not None:
+                parte = compresor.compress(parte)
+            if parte:
+                yield parte
+
+    parte = ''.join(lineas).encode()
+    if compresor is not None:
+        parte = compresor.compress(parte) + compresor.flush()
+    if parte:
+        yield parte
+
+
+async def iterar_en_hilo(iterador):
+    # Bajo ASGI Django convierte un iterador síncrono en lista antes de enviarlo; así cada
+    # parte se produce en el hilo de la base de datos y se envía apenas está lista
+    siguiente = sync_to_async(next)
+    while (parte := await siguiente(iterador, None)) is not None:
+        yield parte
+
+
+def respuesta_csv(request, filas, encabezado, nombre):
+    comprimir = request.GET.get('gzip') == '1'
+    partes = partes_csv(filas, encabezado, comprimir)
+    if isinstance(request, ASGIRequest):
+        partes = iterar_en_hilo(partes)
+
+    if comprimir:
+        response = StreamingHttpResponse(partes, content_type='application/gzip')
+        nombre += '.csv.gz'
+    else:
+        response = StreamingHttpResponse(partes, content_type='text/csv; charset=utf-8')
+        nombre += '.csv'
+    response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return response
@@ -3,6 +3,7 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, User
 from django.contrib.auth import get_user_model
 from .models import Usuario, Institucion, Direccion, Comuna, Ciudad, Region, Pais
 from django.core.exceptions import ValidationError
+from .rut import validar_rut
 
 
 #-----------------Formulario de login -----------------------
@@ -159,47 +160,3 @@ class FullInstitucionForm(forms.ModelForm):
         fields = ['nombre', 'tipo_institucion', 'contacto']
 
 #--------------------- fin del formulario institucion --------------------------------
-
-
-#--------------------------validador rut---------------------------------------
-def validar_rut(rut):
-    # Remover puntos, guiones y otros caracteres no numéricos
-    rut = rut.replace(".", "").replace("-", "")
-    
-    # Verificar que el RUT tenga al menos 9 caracteres (número + dígito verificador)
-    if len(rut) < 8:
-        print("El RUT es demasiado corto.")
-        return False
-
-    # Separar el número del dígito verificador
-    rut_numero = rut[:-1]  # Todo menos el último carácter (número)
-    digito_verificador = rut[-1].upper()  # El último carácter (dígito)
-
-    # Verificar que el número sea efectivamente un número
-    try:
-        rut_numero = int(rut_numero)
-    except ValueError:
-        return False
-
-    # Cálculo del dígito verificador usando el algoritmo del Módulo 11
-    multiplicador = 2
-    suma = 0
-
-    for numero in reversed(str(rut_numero)):
-        suma += int(numero) * multiplicador
-        multiplicador += 1
-        if multiplicador > 7:
-            multiplicador = 2
-
-    # Obtener el dígito verificador esperado
-    resto = 11 - (suma % 11)
-    if resto == 11:
-        digito_verificador_esperado = "0"
-    elif resto == 10:
-        digito_verificador_esperado = "K"
-    else:
-        digito_verificador_esperado = str(resto)
-
-    # Comparar el dígito verificador calculado con el proporcionado
-    return digito_verificador == digito_verificador_esperado
-#------------------------ fin del validador--------------------------------------
\ No newline at end of file
@@ -0,0 +1,19 @@
+# Renderizado de gráficos con matplotlib. Este módulo se importa de forma diferida desde
+# las vistas para que los workers y los comandos de manage.py no carguen matplotlib al iniciar.
+from io import BytesIO
+
+from matplotlib.figure import Figure
+
+
+def grafico_usuarios_png(usuarios_activos, usuarios_inactivos):
+    # Figure directamente (sin pyplot): no usa estado global ni necesita plt.close
+    fig = Figure()
+    ax = fig.subplots()
+    ax.bar(['Activos', 'Inactivos'], [usuarios_activos, usuarios_inactivos], color=['green', 'red'])
+    ax.set_title('Usuarios Activos e Inactivos')
+    ax.set_xlabel('Estado')
+    ax.set_ylabel('Cantidad')
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+
+class CubetaTokens:
+    """Token bucket: permite ráfagas de hasta `capacidad` y un promedio de `tasa` por segundo."""
+
+    def __init__(self, tasa, capacidad):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tokens = capacidad
+        self.ultimo = time.monotonic()
+
+    def consumir(self, cantidad=1):
+        ahora = time.monotonic()
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+        if self.tokens < cantidad:
+            return False
+        self.tokens -= cantidad
+        return True
+
+
+class CoalescedorAcciones:
+    """
+    Agrupa acciones de video que llegan en ráfaga. La primera se publica de inmediato y abre una
+    ventana de `ventana` segundos; las que llegan dentro de la ventana se reducen a su estado final
+    (el último seek y el último play/pause, en el orden en que llegaron) y se publican al cerrarla.
+
+    `publicar` es una corrutina que recibe (accion, tiempo).
+    """
+
+    def __init__(self, publicar, ventana=0.15):
+        self.publicar = publicar
+        self.ventana = ventana
+        self._pendientes = {}  # 'seek' o 'reproduccion' -> (accion, tiempo); el orden es el de llegada
+        self._tarea = None
+
+    async def agregar(self, accion, tiempo):
+        if self._tarea is None:
+            self._tarea = asyncio.ensure_future(self._cerrar_ventana())
+            await self.publicar(accion, tiempo)
+            return
+
+        clave = 'seek' if accion == 'seek' else 'reproduccion'
+        self._pendientes.pop(clave, None)
+        self._pendientes[clave] = (accion, tiempo)
+
+    async def _cerrar_ventana(self):
+        try:
+            while True:
+                await asyncio.sleep(self.ventana)
+                if not self._pendientes:
+                    break
+                # Si había pendientes se publican y se abre otra ventana
+                await self._publicar_pendientes()
+        finally:
+            self._tarea = None
+
+    async def _publicar_pendientes(self):
+        pendientes, self._pendientes = self._pendientes, {}
+        for accion, tiempo in pendientes.values():
+            await self.publicar(accion, tiempo)
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+        await self._publicar_pendientes()
@@ -0,0 +1,219 @@
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.models import ContenidoTerapia, Room, SesionTerapia, Usuario, UsuarioSesion
+from core.routing import websocket_urlpatterns
+from inmersion.canales import BACKENDS, capa_canales, leer_hosts
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula pares terapeuta/paciente conectados a ws/room/<id>/ e informa latencia de fan-out "
+        "(p50/p99), mensajes por segundo y memoria por conexión. Usa una base de datos de prueba "
+        "temporal; no toca los datos reales. Para comparar un Redis contra varios shards: "
+        "--capa fakeredis --shards 1 frente a --shards 4, o --capa redis --redis-url url1,url2."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salas', type=int, default=100, help="Pares terapeuta/paciente simulados.")
+        parser.add_argument('--mensajes', type=int, default=20, help="Mensajes enviados por sala.")
+        parser.add_argument('--capa', choices=['memoria', 'redis', 'fakeredis'], default='memoria',
+                            help="Capa de canales: InMemoryChannelLayer, channels_redis contra --redis-url "
+                                 "o channels_redis contra un servidor fakeredis local (requiere fakeredis y lupa).")
+        parser.add_argument('--redis-url', default='redis://localhost:6379',
+                            help="Servidor Redis (o sustituto compatible) para --capa redis. Varios shards "
+                                 "se indican separados por comas, como en REDIS_HOSTS.")
+        parser.add_argument('--shards', type=int, default=1,
+                            help="Servidores fakeredis a levantar con --capa fakeredis.")
+        parser.add_argument('--tipo', choices=list(BACKENDS), default='redis',
+                            help="Implementación de channels_redis: RedisChannelLayer o RedisPubSubChannelLayer.")
+        parser.add_argument('--timeout', type=float, default=5.0, help="Segundos de espera por mensaje.")
+
+    def handle(self, *args, **options):
+        if options['capa'] == 'fakeredis':
+            options['redis_url'] = ','.join(iniciar_fakeredis() for _ in range(options['shards']))
+
+        if options['capa'] in ('redis', 'fakeredis'):
+            hosts = leer_hosts(options['redis_url'])
+            # RedisPubSubChannelLayer no tiene cola por canal, así que no acepta 'capacity'
+            extra = {'capacity': 10000} if options['tipo'] == 'redis' else {}
+            capa = capa_canales(hosts, options['tipo'], **extra)
+        else:
+            capa = {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 10000}}
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            salas = self.crear_salas(options['salas'])
+            # Sin límite de acciones, ventana de agrupación ni intervalo de relevo del pulso: se mide
+            # el fan-out, no el control de ráfagas, y cada trama enviada tiene un reenvío esperado
+            with override_settings(CHANNEL_LAYERS={'default': capa}, WS_TASA_MENSAJES=float('inf'),
+                                   WS_RAFAGA_MENSAJES=float('inf'), VIDEO_VENTANA_COALESCENCIA=0,
+                                   VITALES_INTERVALO_RELEVO=0):
+                resultado = asyncio.run(self.simular(salas, options['mensajes'], options['timeout']))
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        self.informar(resultado, options)
+
+    def crear_salas(self, cantidad):
+        contenido = ContenidoTerapia.objects.create(
+            titulo='benchmark', url_contenido='https://example.com', descripcion='',
+            fecha_publicacion=timezone.now().date(),
+        )
+        usuarios = []
+        for i in range(cantidad):
+            usuarios.append(Usuario(rut=f"T{i}", email=f"t{i}@benchmark.cl", rol=2))
+            usuarios.append(Usuario(rut=f"P{i}", email=f"p{i}@benchmark.cl", rol=1))
+        Usuario.objects.bulk_create(usuarios, batch_size=1000)
+        usuarios = list(Usuario.objects.order_by('id'))
+        terapeutas, pacientes = usuarios[0::2], usuarios[1::2]
+
+        Room.objects.bulk_create(
+            [Room(terapeuta=t, paciente=p) for t, p in zip(terapeutas, pacientes)], batch_size=1000
+        )
+        sesiones = SesionTerapia.objects.bulk_create(
+            [SesionTerapia(contenido=contenido, fecha_sesion=timezone.now(), duracion=60, resultado=1)
+             for _ in pacientes], batch_size=1000
+        )
+        UsuarioSesion.objects.bulk_create(
+            [UsuarioSesion(usuario=p, sesion=s, rol=1) for p, s in zip(pacientes, sesiones)], batch_size=1000
+        )
+        return [(sala.id, sala.terapeuta, sala.paciente)
+                for sala in Room.objects.select_related('terapeuta', 'paciente').order_by('id')]
+
+    async def simular(self, salas, mensajes, timeout):
+        aplicacion = URLRouter(websocket_urlpatterns)
+
+        # Memoria: solo se mide la fase de conexión para no contar los mensajes en tránsito
+        tracemalloc.start()
+        inicio_memoria = tracemalloc.take_snapshot()
+        inicio = time.perf_counter()
+        pares = await asyncio.gather(*[self.conectar(aplicacion, *sala, timeout) for sala in salas])
+        segundos_conexion = time.perf_counter() - inicio
+        memoria = sum(
+            stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(inicio_memoria, 'filename')
+        )
+        tracemalloc.stop()
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*[self.conversar(t, p, mensajes, timeout) for t, p in pares])
+        segundos_mensajes = time.perf_counter() - inicio
+
+        for terapeuta, paciente in pares:
+            await terapeuta.disconnect()
+            await paciente.disconnect()
+
+        latencias = [latencia for resultado in resultados for latencia in resultado['latencias']]
+        return {
+            'conexiones': 2 * len(pares),
+            'segundos_conexion': segundos_conexion,
+            'memoria_por_conexion': memoria / max(2 * len(pares), 1),
+            'enviados': sum(resultado['enviados'] for resultado in resultados),
+            'entregados': len(latencias),
+            'segundos_mensajes': segundos_mensajes,
+            'latencias': latencias,
+        }
+
+    async def conectar(self, aplicacion, room_id, terapeuta, paciente, timeout):
+        comunicadores = []
+        for usuario in (terapeuta, paciente):
+            comunicador = WebsocketCommunicator(aplicacion, f"/ws/room/{room_id}/")
+            comunicador.scope['user'] = usuario
+            conectado, _ = await comunicador.connect(timeout=timeout)
+            if not conectado:
+                raise RuntimeError(f"No se pudo conectar a la sala {room_id}.")
+            await esperar(comunicador, lambda datos: 'historial' in datos, timeout)
+            comunicadores.append(comunicador)
+        return comunicadores
+
+    async def conversar(self, terapeuta, paciente, mensajes, timeout):
+        latencias = []
+        enviados = 0
+        for i in range(mensajes):
+            # Alterna chat, acciones de video y signos vitales. El pulso suavizado se reenvía solo
+            # al terapeuta (sin eco al paciente); los valores varían poco para que el suavizador
+            # no los descarte como artefactos
+            if i % 3 == 2:
+                inicio = time.perf_counter()
+                await paciente.send_json_to({'vitals': [{'bpm': 60 + i % 10}]})
+                enviados += 1
+                if await esperar(terapeuta, lambda datos: 'pulso' in datos, timeout) is not None:
+                    latencias.append(time.perf_counter() - inicio)
+                continue
+
+            if i % 3 == 0:
+                mensaje, esperado = {'message': f"benchmark {i}"}, (lambda datos: 'message' in datos)
+            else:
+                mensaje, esperado = {'action': 'seek', 'time': i}, (lambda datos: 'action' in datos)
+
+            inicio = time.perf_counter()
+            await terapeuta.send_json_to(mensaje)
+            enviados += 1
+            if await esperar(paciente, esperado, timeout) is not None:
+                latencias.append(time.perf_counter() - inicio)
+            await esperar(terapeuta, esperado, timeout)
+        return {'latencias': latencias, 'enviados': enviados}
+
+    def informar(self, resultado, options):
+        latencias = sorted(resultado['latencias'])
+
+        def percentil(p):
+            if not latencias:
+                return float('nan')
+            return latencias[min(int(len(latencias) * p), len(latencias) - 1)] * 1000
+
+        capa = options['capa']
+        if capa != 'memoria':
+            capa += f" ({options['tipo']}, {len(leer_hosts(options['redis_url']))} shard(s))"
+        self.stdout.write(f"Capa de canales:          {capa}")
+        self.stdout.write(f"Conexiones:               {resultado['conexiones']} "
+                          f"({resultado['segundos_conexion']:.2f} s en conectar)")
+        self.stdout.write(f"Memoria por conexión:     {resultado['memoria_por_conexion'] / 1024:.1f} KiB")
+        self.stdout.write(f"Mensajes enviados:        {resultado['enviados']}")
+        self.stdout.write(f"Reenvíos a la sala:       {resultado['entregados']} entregados "
+                          f"de {resultado['enviados']} esperados")
+        self.stdout.write(f"Mensajes por segundo:     "
+                          f"{resultado['enviados'] / resultado['segundos_mensajes']:.0f}")
+        if latencias:
+            self.stdout.write(f"Latencia fan-out p50:     {percentil(0.50):.2f} ms")
+            self.stdout.write(f"Latencia fan-out p99:     {percentil(0.99):.2f} ms")
+            self.stdout.write(f"Latencia fan-out media:   {statistics.mean(latencias) * 1000:.2f} ms")
+
+
+async def esperar(comunicador, predicado, timeout):
+    """Espera el siguiente mensaje que cumpla el predicado, descartando los demás. None si vence el plazo."""
+    limite = time.perf_counter() + timeout
+    while True:
+        restante = limite - time.perf_counter()
+        if restante <= 0:
+            return None
+        try:
+            datos = await comunicador.receive_json_from(timeout=restante)
+        except asyncio.TimeoutError:
+            return None
+        if predicado(datos):
+            return datos
+
+
+def iniciar_fakeredis():
+    """Levanta un servidor fakeredis en un puerto libre como sustituto de Redis y devuelve su URL."""
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        raise CommandError("--capa fakeredis requiere instalar fakeredis[lua].")
+
+    servidor = TcpFakeServer(('127.0.0.1', 0))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address
+    return f"redis://{host}:{puerto}"
@@ -0,0 +1,211 @@
+import csv
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from core import versiones
+from core.forms import validar_rut
+from core.models import Contador, Institucion, Usuario
+from core.rut import normalizar_rut
+from core.signals import contadores_habilitados
+
+COLUMNAS_OBLIGATORIAS = {'rut', 'email'}
+ROLES = dict(Usuario.ROL_CHOICES)
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa usuarios desde un CSV con columnas rut, email y opcionalmente first_name, last_name, rol, "
+        "institucion (id) y password. El archivo se procesa por lotes: valida los RUT, comprueba en una "
+        "consulta por lote que rut y email no existan, calcula los hash de contraseña en varios procesos "
+        "e inserta con bulk_create. Las filas con errores se informan y no detienen la importación."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del CSV ('-' para leer de la entrada estándar).")
+        parser.add_argument('--lote', type=int, default=1000, help="Filas validadas e insertadas por lote.")
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help="Procesos para calcular los hash de contraseña.")
+        parser.add_argument('--rol', type=int, choices=list(ROLES), default=1,
+                            help="Rol de las filas sin columna rol (por defecto Paciente).")
+        parser.add_argument('--institucion', type=int, help="Institución de las filas sin columna institucion.")
+        parser.add_argument('--delimitador', default=',', help="Separador de columnas del CSV.")
+        parser.add_argument('--errores', help="Guarda las filas rechazadas en este CSV (línea, rut, error).")
+        parser.add_argument('--simular', action='store_true', help="Valida todo el archivo sin insertar nada.")
+
+    def handle(self, *args, **options):
+        if options['institucion'] is not None and not Institucion.objects.filter(id=options['institucion']).exists():
+            raise CommandError(f"La institución {options['institucion']} no existe.")
+        self.instituciones = set(Institucion.objects.values_list('id', flat=True))
+        self.opciones = options
+        # RUT normalizados y emails ya vistos en el archivo, para rechazar duplicados entre lotes
+        self.ruts_vistos = set()
+        self.emails_vistos = set()
+        self.errores = []
+        self.creados = 0
+        self.segundos_hash = 0.0
+
+        archivo = sys.stdin if options['archivo'] == '-' else open(options['archivo'], newline='', encoding='utf-8-sig')
+        inicio = time.perf_counter()
+        try:
+            lector = csv.DictReader(archivo, delimiter=options['delimitador'])
+            faltantes = COLUMNAS_OBLIGATORIAS - set(lector.fieldnames or [])
+            if faltantes:
+                raise CommandError(f"Faltan columnas en el CSV: {', '.join(sorted(faltantes))}")
+
+            with ProcessPoolExecutor(max_workers=options['procesos'], initializer=iniciar_proceso) as procesos:
+                lote = []
+                # La línea 1 es el encabezado
+                for linea, fila in enumerate(lector, start=2):
+                    lote.append((linea, fila))
+                    if len(lote) >= options['lote']:
+                        self.importar_lote(lote, procesos)
+                        lote = []
+                if lote:
+                    self.importar_lote(lote, procesos)
+        finally:
+            if archivo is not sys.stdin:
+                archivo.close()
+
+        self.informar(time.perf_counter() - inicio)
+
+    def importar_lote(self, lote, procesos):
+        validas = self.validar(lote)
+        if not validas:
+            return
+        if self.opciones['simular']:
+            self.creados += len(validas)
+            return
+
+        # PBKDF2 es intencionalmente lento: el costo del lote se reparte entre los procesos
+        inicio = time.perf_counter()
+        contrasenas = [fila.get('password') or None for _, fila, _ in validas]
+        por_proceso = max(1, len(contrasenas) // (self.opciones['procesos'] * 4))
+        hashes = list(procesos.map(make_password, contrasenas, chunksize=por_proceso))
+        self.segundos_hash += time.perf_counter() - inicio
+
+        usuarios = []
+        for (_, _, usuario), password in zip(validas, hashes):
+            usuario.password = password
+            usuarios.append(usuario)
+
+        try:
+            with transaction.atomic():
+                Usuario.objects.bulk_create(usuarios)
+        except IntegrityError as e:
+            # Otro proceso insertó alguno de estos rut o email después de la verificación
+            for linea, fila, _ in validas:
+                self.errores.append((linea, fila.get('rut', ''), f"No se pudo insertar el lote: {e}"))
+            return
+
+        self.creados += len(usuarios)
+        self.despues_de_insertar(usuarios)
+
+    def validar(self, lote):
+        """Devuelve [(línea, fila, Usuario sin guardar)] de las filas válidas y registra las demás."""
+        candidatas = []
+        for linea, fila in lote:
+            rut = (fila.get('rut') or '').strip().upper()
+            # Los duplicados se comparan por RUT normalizado: "12.345.678-5" y "12345678-5" son el mismo
+            rut_normalizado = normalizar_rut(rut)
+            email = Usuario.objects.normalize_email((fila.get('email') or '').strip())
+            try:
+                if not validar_rut(rut):
+                    raise ValidationError("RUT inválido.")
+                if len(rut) > Usuario._meta.get_field('rut').max_length:
+                    raise ValidationError("RUT demasiado largo.")
+                validate_email(email)
+                rol = int(fila.get('rol') or self.opciones['rol'])
+                if rol not in ROLES:
+                    raise ValidationError(f"Rol desconocido: {rol}.")
+                institucion = fila.get('institucion')
+                institucion = int(institucion) if institucion else self.opciones['institucion']
+                if institucion is not None and institucion not in self.instituciones:
+                    raise ValidationError(f"La institución {institucion} no existe.")
+                if rut_normalizado in self.ruts_vistos:
+                    raise ValidationError("RUT repetido en el archivo.")
+                if email in self.emails_vistos:
+                    raise ValidationError("Email repetido en el archivo.")
+            except ValueError:
+                self.errores.append((linea, rut, "Rol o institución no numérico."))
+                continue
+            except ValidationError as e:
+                self.errores.append((linea, rut, ' '.join(e.messages)))
+                continue
+
+            self.ruts_vistos.add(rut_normalizado)
+            self.emails_vistos.add(email)
+            candidatas.append((linea, fila, Usuario(
+                rut=rut,
+                rut_normalizado=rut_normalizado,
+                email=email,
+                first_name=(fila.get('first_name') or '').strip()[:30],
+                last_name=(fila.get('last_name') or '').strip()[:30],
+                rol=rol,
+                institucion_id=institucion,
+            )))
+
+        if not candidatas:
+            return []
+
+        # Una consulta por columna para todo el lote en vez de una por fila
+        ruts_existentes = set(Usuario.objects.filter(
+            rut_normalizado__in=[usuario.rut_normalizado for _, _, usuario in candidatas]
+        ).values_list('rut_normalizado', flat=True))
+        emails_existentes = set(Usuario.objects.filter(
+            email__in=[usuario.email for _, _, usuario in candidatas]
+        ).values_list('email', flat=True))
+
+        validas = []
+        for linea, fila, usuario in candidatas:
+            if usuario.rut_normalizado in ruts_existentes:
+                self.errores.append((linea, usuario.rut, "Ya existe un usuario con este RUT."))
+            elif usuario.email in emails_existentes:
+                self.errores.append((linea, usuario.rut, "Ya existe un usuario con este email."))
+            else:
+                validas.append((linea, fila, usuario))
+        return validas
+
+    def despues_de_insertar(self, usuarios):
+        # bulk_create no envía señales: se hace aquí lo que harían los receptores de post_save
+        instituciones = Counter(usuario.institucion_id for usuario in usuarios if usuario.institucion_id)
+        for institucion_id in instituciones:
+            versiones.renovar('pacientes', institucion_id)
+
+        if contadores_habilitados():
+            Contador.objects.incrementar(Contador.USUARIOS_ACTIVOS, len(usuarios))
+            for institucion_id, cantidad in instituciones.items():
+                Contador.objects.incrementar(Contador.clave_institucion(institucion_id), cantidad, institucion_id)
+
+    def informar(self, segundos):
+        for linea, rut, error in self.errores:
+            self.stderr.write(f"Línea {linea} ({rut or 'sin RUT'}): {error}")
+
+        if self.opciones['errores'] and self.errores:
+            with open(self.opciones['errores'], 'w', newline='', encoding='utf-8') as salida:
+                escritor = csv.writer(salida)
+                escritor.writerow(['linea', 'rut', 'error'])
+                escritor.writerows(self.errores)
+
+        accion = "validarían" if self.opciones['simular'] else "importaron"
+        self.stdout.write(self.style.SUCCESS(
+            f"Se {accion} {self.creados} usuarios en {segundos:.1f} s "
+            f"({self.creados / segundos if segundos else 0:.0f} usuarios/s; "
+            f"{self.segundos_hash:.1f} s calculando contraseñas con {self.opciones['procesos']} procesos)."
+        ))
+        if self.errores:
+            self.stdout.write(self.style.WARNING(f"{len(self.errores)} filas rechazadas."))
+
+
+def iniciar_proceso():
+    # Con el método 'spawn' (macOS, Windows) cada proceso hijo debe cargar Django para usar los hashers
+    import django
+    django.setup()
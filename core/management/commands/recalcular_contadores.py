@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from core.models import Contador, Institucion, Usuario
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero los contadores materializados del dashboard."
+
+    def handle(self, *args, **options):
+        usuarios = Usuario.objects.aggregate(
+            activos=Count('id', filter=Q(is_active=True)),
+            inactivos=Count('id', filter=Q(is_active=False)),
+        )
+        por_institucion = Institucion.objects.annotate(num_usuarios=Count('usuario')).values_list('id', 'num_usuarios')
+
+        contadores = [
+            Contador(clave=Contador.USUARIOS_ACTIVOS, valor=usuarios['activos']),
+            Contador(clave=Contador.USUARIOS_INACTIVOS, valor=usuarios['inactivos']),
+        ]
+        for institucion_id, num_usuarios in por_institucion:
+            contadores.append(Contador(
+                clave=Contador.clave_institucion(institucion_id),
+                valor=num_usuarios,
+                institucion_id=institucion_id,
+            ))
+
+        with transaction.atomic():
+            Contador.objects.all().delete()
+            Contador.objects.bulk_create(contadores, batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f"Se recalcularon {len(contadores)} contadores."))
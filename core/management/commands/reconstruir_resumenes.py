@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import ResumenSesion, SignosVitalesBloque
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde los bloques de signos vitales los resúmenes por sesión."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sesion', type=int, nargs='*', help="IDs de sesión a recalcular (por defecto todas).")
+        parser.add_argument('--lote', type=int, default=500, help="Resúmenes insertados por consulta.")
+
+    def handle(self, *args, **options):
+        bloques = SignosVitalesBloque.objects.all()
+        if options['sesion']:
+            bloques = bloques.filter(sesion_id__in=options['sesion'])
+
+        # Un solo recorrido ordenado de los bloques; cada resumen se cierra al cambiar de (sesión, usuario)
+        filas = bloques.order_by('sesion_id', 'usuario_id', 'minuto').only(
+            'sesion_id', 'usuario_id', 'minuto', 'n_muestras', 'datos'
+        )
+
+        resumenes = []
+        actual = None
+        for bloque in filas.iterator(chunk_size=options['lote']):
+            if actual is None or (actual.sesion_id, actual.usuario_id) != (bloque.sesion_id, bloque.usuario_id):
+                actual = ResumenSesion(sesion_id=bloque.sesion_id, usuario_id=bloque.usuario_id)
+                resumenes.append(actual)
+            actual.acumular(bloque.muestras_con_fecha())
+
+        with transaction.atomic():
+            existentes = ResumenSesion.objects.all()
+            if options['sesion']:
+                existentes = existentes.filter(sesion_id__in=options['sesion'])
+            existentes.delete()
+            ResumenSesion.objects.bulk_create(resumenes, batch_size=options['lote'])
+
+        self.stdout.write(self.style.SUCCESS(f"Se reconstruyeron {len(resumenes)} resúmenes de sesión."))
@@ -0,0 +1,86 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:29
+
+import sys
+from array import array
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copias de core.models al momento de esta migración: el formato empaquetado de los bloques
+# que crea no debe cambiar si después cambian las funciones del modelo
+def empaquetar_muestras(muestras):
+    offsets = array('H', (offset for offset, _ in muestras))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    return offsets.tobytes() + bytes(bpm for _, bpm in muestras)
+
+
+def inicio_minuto(momento):
+    return momento.replace(second=0, microsecond=0)
+
+
+def copiar_signos_vitales(apps, schema_editor):
+    # Empaqueta las mediciones de la tabla histórica en bloques por minuto
+    SignosVitales = apps.get_model('core', 'SignosVitales')
+    SignosVitalesBloque = apps.get_model('core', 'SignosVitalesBloque')
+
+    bloques = []
+    clave_actual = None
+    muestras = []
+
+    def cerrar_bloque():
+        if muestras:
+            usuario_id, sesion_id, minuto = clave_actual
+            bloques.append(SignosVitalesBloque(
+                usuario_id=usuario_id,
+                sesion_id=sesion_id,
+                minuto=minuto,
+                n_muestras=len(muestras),
+                datos=empaquetar_muestras(muestras),
+            ))
+
+    filas = SignosVitales.objects.order_by('usuario_id', 'sesion_id', 'fecha_medicion').values_list(
+        'usuario_id', 'sesion_id', 'fecha_medicion', 'frecuencia_cardiaca'
+    )
+    for usuario_id, sesion_id, fecha, bpm in filas.iterator(chunk_size=2000):
+        minuto = inicio_minuto(fecha)
+        clave = (usuario_id, sesion_id, minuto)
+        if clave != clave_actual:
+            cerrar_bloque()
+            clave_actual = clave
+            muestras = []
+        muestras.append(((fecha - minuto) // timedelta(milliseconds=1), min(bpm, 255)))
+
+        if len(bloques) >= 500:
+            SignosVitalesBloque.objects.bulk_create(bloques)
+            bloques = []
+    cerrar_bloque()
+    SignosVitalesBloque.objects.bulk_create(bloques)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_usuario_groups_alter_usuario_user_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignosVitalesBloque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minuto', models.DateTimeField()),
+                ('n_muestras', models.PositiveSmallIntegerField(default=0)),
+                ('datos', models.BinaryField()),
+                ('sesion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.sesionterapia')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sesion', 'usuario', 'minuto'), name='bloque_vitales_unico')],
+            },
+        ),
+        migrations.RunPython(copiar_signos_vitales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_signosvitalesbloque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenSesion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n_muestras', models.PositiveIntegerField(default=0)),
+                ('suma_bpm', models.BigIntegerField(default=0)),
+                ('suma_cuadrados', models.BigIntegerField(default=0)),
+                ('bpm_minimo', models.PositiveSmallIntegerField(null=True)),
+                ('bpm_maximo', models.PositiveSmallIntegerField(null=True)),
+                ('segundos_zona_elevada', models.FloatField(default=0)),
+                ('segundos_zona_alta', models.FloatField(default=0)),
+                ('ultima_medicion', models.DateTimeField(null=True)),
+                ('ultimo_bpm', models.PositiveSmallIntegerField(null=True)),
+                ('sesion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='core.sesionterapia')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sesion', 'usuario'), name='resumen_sesion_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_contador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Mensaje',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.PositiveSmallIntegerField(choices=[(1, 'Chat'), (2, 'Acción de video')])),
+                ('contenido', models.TextField(blank=True)),
+                ('accion', models.CharField(blank=True, max_length=10)),
+                ('tiempo', models.FloatField(null=True)),
+                ('fecha_envio', models.DateTimeField(default=django.utils.timezone.now)),
+                ('autor', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mensajes', to='core.room')),
+            ],
+        ),
+    ]
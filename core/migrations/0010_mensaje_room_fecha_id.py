@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_mensaje'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['room', '-fecha_envio', '-id'], name='mensaje_room_fecha_id'),
+        ),
+    ]
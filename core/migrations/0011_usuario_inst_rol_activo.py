@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0010_mensaje_room_fecha_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['institucion', 'rol', 'is_active'], name='usuario_inst_rol_activo'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_usuario_inst_rol_activo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UmbralesPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bpm_reposo', models.PositiveSmallIntegerField(default=70)),
+                ('margen_elevacion', models.PositiveSmallIntegerField(default=30)),
+                ('segundos_elevacion', models.PositiveSmallIntegerField(default=60)),
+                ('bpm_maximo', models.PositiveSmallIntegerField(default=160)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='umbrales', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:53
+
+from django.db import migrations, models
+
+from core.rut import normalizar_rut
+
+# Índices trigram para la búsqueda aproximada; solo existen en PostgreSQL (pg_trgm)
+CAMPOS_TRIGRAM = ['rut_normalizado', 'first_name', 'last_name', 'email']
+
+
+def normalizar_ruts(apps, schema_editor):
+    Usuario = apps.get_model('core', 'Usuario')
+    pendientes = []
+    for usuario in Usuario.objects.only('id', 'rut').iterator(chunk_size=2000):
+        usuario.rut_normalizado = normalizar_rut(usuario.rut)
+        pendientes.append(usuario)
+        if len(pendientes) >= 2000:
+            Usuario.objects.bulk_update(pendientes, ['rut_normalizado'])
+            pendientes = []
+    if pendientes:
+        Usuario.objects.bulk_update(pendientes, ['rut_normalizado'])
+
+
+def crear_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for campo in CAMPOS_TRIGRAM:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "usuario_{campo}_trgm" ON "core_usuario" USING gin ("{campo}" gin_trgm_ops)'
+        )
+
+
+def eliminar_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for campo in CAMPOS_TRIGRAM:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "usuario_{campo}_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_umbralespaciente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='rut_normalizado',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(normalizar_ruts, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_trigram, eliminar_indices_trigram),
+    ]
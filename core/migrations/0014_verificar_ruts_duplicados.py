@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:07
+
+from django.db import migrations
+from django.db.models import Count
+
+from core.rut import normalizar_rut
+
+
+def verificar_ruts_duplicados(apps, schema_editor):
+    Usuario = apps.get_model('core', 'Usuario')
+
+    # Filas creadas con bulk_create después de 0013 pueden haber quedado sin normalizar
+    pendientes = []
+    for usuario in Usuario.objects.filter(rut_normalizado='').only('id', 'rut').iterator(chunk_size=2000):
+        usuario.rut_normalizado = normalizar_rut(usuario.rut)
+        pendientes.append(usuario)
+    Usuario.objects.bulk_update(pendientes, ['rut_normalizado'], batch_size=2000)
+
+    duplicados = (
+        Usuario.objects.values('rut_normalizado')
+        .annotate(cantidad=Count('id'))
+        .filter(cantidad__gt=1)
+        .values_list('rut_normalizado', flat=True)
+    )
+    if not duplicados:
+        return
+
+    # No se decide aquí qué cuenta conservar: se informan y la migración se detiene
+    lineas = []
+    for rut_normalizado in duplicados:
+        cuentas = Usuario.objects.filter(rut_normalizado=rut_normalizado).order_by('id').values_list('id', 'rut', 'email')
+        lineas.append(f"  {rut_normalizado}: " + ", ".join(f"id={id} rut={rut} email={email}" for id, rut, email in cuentas))
+    raise RuntimeError(
+        "Hay usuarios distintos con el mismo RUT en distinto formato. Fusione o corrija estas cuentas "
+        "antes de aplicar la migración:\n" + "\n".join(lineas)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_usuario_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_ruts_duplicados, migrations.RunPython.noop),
+    ]
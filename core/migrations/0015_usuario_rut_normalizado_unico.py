@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_verificar_ruts_duplicados'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usuario',
+            name='rut_normalizado',
+            field=models.CharField(default='', editable=False, max_length=12, unique=True),
+        ),
+    ]
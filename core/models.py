@@ -1,6 +1,18 @@
-from django.db import models
+import base64
+import binascii
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import PermissionsMixin, Group, Permission, BaseUserManager, AbstractBaseUser
 
+from .rut import normalizar_rut
+
 # Manager personalizado
 class UsuarioManager(BaseUserManager):
     def create_user(self, rut, password=None, **extra_fields):
@@ -24,6 +36,13 @@ class UsuarioManager(BaseUserManager):
         
         return self.create_user(rut, password, **extra_fields)
 
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create no pasa por Usuario.save(), que es donde se normaliza el RUT
+        objs = list(objs)
+        for usuario in objs:
+            usuario.rut_normalizado = normalizar_rut(usuario.rut)
+        return super().bulk_create(objs, *args, **kwargs)
+
 class Usuario(AbstractBaseUser, PermissionsMixin):
     ROL_CHOICES = [
         (1, 'Paciente'),
@@ -37,6 +56,9 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
 
     # Campos personalizados
     rut = models.CharField(max_length=12, unique=True)
+    # RUT sin puntos ni guion (core.rut.normalizar_rut) para buscar sin depender del formato ingresado.
+    # Es único: "12.345.678-5" y "12345678-5" son la misma persona aunque rut los acepte como distintos
+    rut_normalizado = models.CharField(max_length=12, unique=True, editable=False, default='')
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
     fecha_registro = models.DateField(auto_now_add=True)
@@ -58,6 +80,20 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
     def str(self):
         return f"{self.rut}"
 
+    def clean(self):
+        super().clean()
+        # rut_normalizado no es editable y los formularios no validan su unicidad por sí solos
+        duplicados = Usuario.objects.filter(rut_normalizado=normalizar_rut(self.rut)).exclude(pk=self.pk)
+        if duplicados.exists():
+            raise ValidationError({'rut': "Ya existe un usuario con este RUT."})
+
+    def save(self, *args, **kwargs):
+        self.rut_normalizado = normalizar_rut(self.rut)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rut' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'rut_normalizado'}
+        super().save(*args, **kwargs)
+
     # Mapeo de grupos y permisos
     groups = models.ManyToManyField(
         Group,
@@ -74,6 +110,12 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         help_text='Permisos específicos del usuario.',
         verbose_name='permisos de usuario'
     )
+
+    class Meta:
+        indexes = [
+            # Listado de pacientes de una institución (listarPacientes)
+            models.Index(fields=['institucion', 'rol', 'is_active'], name='usuario_inst_rol_activo'),
+        ]
     
 class Institucion(models.Model):
     TIPO_CHOICES = [
@@ -161,6 +203,7 @@ class UsuarioSesion(models.Model):
         return f"Usuario {self.usuario} en {self.sesion}"
 
 
+# Tabla histórica con una fila por medición. Las muestras nuevas se guardan en SignosVitalesBloque.
 class SignosVitales(models.Model):
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     sesion = models.ForeignKey(SesionTerapia, on_delete=models.CASCADE)
@@ -172,6 +215,213 @@ class SignosVitales(models.Model):
         return f"Signos Vitales de {self.usuario} - Frecuencia: {self.frecuencia_cardiaca} bpm"
 
 
+#--------------------------Almacenamiento compacto de signos vitales--------------------------------
+# Cada bloque guarda las muestras de un minuto como dos arreglos empaquetados:
+# los milisegundos desde el inicio del minuto (uint16 little-endian) y los bpm (uint8).
+# Son 3 bytes por muestra en vez de una fila completa con sus índices.
+def empaquetar_muestras(muestras):
+    offsets = array('H', (offset for offset, _ in muestras))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    return offsets.tobytes() + bytes(bpm for _, bpm in muestras)
+
+
+def desempaquetar_muestras(datos, n_muestras):
+    datos = bytes(datos)
+    offsets = array('H')
+    offsets.frombytes(datos[:2 * n_muestras])
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    return list(zip(offsets, datos[2 * n_muestras:]))
+
+
+def inicio_minuto(momento):
+    return momento.replace(second=0, microsecond=0)
+
+
+class SignosVitalesBloqueManager(models.Manager):
+    def registrar(self, usuario_id, sesion_id, momento, bpm):
+        self.agregar_muestras(usuario_id, sesion_id, [(momento, bpm)])
+
+    def agregar_muestras(self, usuario_id, sesion_id, muestras):
+        """
+        Agrega muestras (datetime, bpm) a los bloques de sus minutos, creando los que falten.
+        Un lote de muestras cuesta a lo más dos lecturas y dos escrituras, sin importar su tamaño.
+        """
+        muestras = list(muestras)
+        por_minuto = defaultdict(list)
+        for momento, bpm in muestras:
+            minuto = inicio_minuto(momento)
+            por_minuto[minuto].append(((momento - minuto) // timedelta(milliseconds=1), bpm))
+
+        if not por_minuto:
+            return
+
+        with transaction.atomic(using=self.db):
+            bloques = self.select_for_update().filter(usuario_id=usuario_id, sesion_id=sesion_id)
+            existentes = {bloque.minuto: bloque for bloque in bloques.filter(minuto__in=list(por_minuto))}
+            faltantes = [minuto for minuto in por_minuto if minuto not in existentes]
+            if faltantes:
+                # Otro vaciado puede estar creando el mismo minuto: se insertan bloques vacíos sin fallar
+                # por la restricción única y luego se bloquean, sean propios o del otro proceso
+                self.bulk_create(
+                    [self.model(usuario_id=usuario_id, sesion_id=sesion_id, minuto=minuto, datos=b'')
+                     for minuto in faltantes],
+                    ignore_conflicts=True,
+                )
+                existentes.update((bloque.minuto, bloque) for bloque in bloques.filter(minuto__in=faltantes))
+
+            for minuto, nuevas in por_minuto.items():
+                bloque = existentes[minuto]
+                nuevas = bloque.muestras_del_minuto() + nuevas
+                nuevas.sort()
+                bloque.n_muestras = len(nuevas)
+                bloque.datos = empaquetar_muestras(nuevas)
+            self.bulk_update(list(existentes.values()), ['n_muestras', 'datos'])
+
+            ResumenSesion.objects.acumular(usuario_id, sesion_id, muestras)
+
+    def muestras(self, sesion_id, usuario_id=None):
+        """Itera las muestras (datetime, bpm) de una sesión en orden cronológico."""
+        bloques = self.filter(sesion_id=sesion_id)
+        if usuario_id is not None:
+            bloques = bloques.filter(usuario_id=usuario_id)
+        for bloque in bloques.order_by('minuto').iterator(chunk_size=500):
+            yield from bloque.muestras_con_fecha()
+
+
+class SignosVitalesBloque(models.Model):
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    sesion = models.ForeignKey(SesionTerapia, on_delete=models.CASCADE)
+    minuto = models.DateTimeField()  # Inicio del minuto que cubre el bloque
+    n_muestras = models.PositiveSmallIntegerField(default=0)
+    datos = models.BinaryField()
+
+    objects = SignosVitalesBloqueManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sesion', 'usuario', 'minuto'], name='bloque_vitales_unico'),
+        ]
+
+    def muestras_del_minuto(self):
+        return desempaquetar_muestras(self.datos, self.n_muestras)
+
+    def muestras_con_fecha(self):
+        return [
+            (self.minuto + timedelta(milliseconds=offset), bpm)
+            for offset, bpm in self.muestras_del_minuto()
+        ]
+
+    def __str__(self):
+        return f"Signos Vitales de {self.usuario_id} - {self.minuto} ({self.n_muestras} muestras)"
+
+
+#--------------------------Resumen de signos vitales por sesión--------------------------------
+class ResumenSesionManager(models.Manager):
+    def acumular(self, usuario_id, sesion_id, muestras):
+        """Incorpora un lote de muestras al resumen de la sesión sin volver a leer sus bloques."""
+        with transaction.atomic(using=self.db):
+            resumen, _ = self.select_for_update().get_or_create(usuario_id=usuario_id, sesion_id=sesion_id)
+            resumen.acumular(muestras)
+            resumen.save()
+        return resumen
+
+
+class ResumenSesion(models.Model):
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    sesion = models.ForeignKey(SesionTerapia, on_delete=models.CASCADE, related_name='resumenes')
+    n_muestras = models.PositiveIntegerField(default=0)
+    # Sumas exactas (los bpm son enteros) para obtener promedio y desviación en O(1)
+    suma_bpm = models.BigIntegerField(default=0)
+    suma_cuadrados = models.BigIntegerField(default=0)
+    bpm_minimo = models.PositiveSmallIntegerField(null=True)
+    bpm_maximo = models.PositiveSmallIntegerField(null=True)
+    segundos_zona_elevada = models.FloatField(default=0)  # Sobre VITALES_UMBRAL_ELEVADO
+    segundos_zona_alta = models.FloatField(default=0)  # Sobre VITALES_UMBRAL_ALTO
+    # Última muestra acumulada, necesaria para medir el tiempo en zona entre lotes
+    ultima_medicion = models.DateTimeField(null=True)
+    ultimo_bpm = models.PositiveSmallIntegerField(null=True)
+
+    objects = ResumenSesionManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sesion', 'usuario'], name='resumen_sesion_unico'),
+        ]
+
+    @property
+    def bpm_promedio(self):
+        if not self.n_muestras:
+            return None
+        return self.suma_bpm / self.n_muestras
+
+    @property
+    def bpm_desviacion(self):
+        if not self.n_muestras:
+            return None
+        varianza = self.suma_cuadrados / self.n_muestras - self.bpm_promedio ** 2
+        return max(varianza, 0) ** 0.5
+
+    def acumular(self, muestras):
+        umbral_elevado = getattr(settings, 'VITALES_UMBRAL_ELEVADO', 100)
+        umbral_alto = getattr(settings, 'VITALES_UMBRAL_ALTO', 120)
+        # Un hueco mayor a este (p. ej. el sensor se desconectó) no cuenta como tiempo en zona
+        brecha_maxima = getattr(settings, 'VITALES_BRECHA_MAXIMA', 5.0)
+
+        for momento, bpm in sorted(muestras):
+            self.n_muestras += 1
+            self.suma_bpm += bpm
+            self.suma_cuadrados += bpm * bpm
+            self.bpm_minimo = bpm if self.bpm_minimo is None else min(self.bpm_minimo, bpm)
+            self.bpm_maximo = bpm if self.bpm_maximo is None else max(self.bpm_maximo, bpm)
+
+            if self.ultima_medicion is not None and momento <= self.ultima_medicion:
+                # Muestra atrasada: cuenta para las estadísticas pero no para el tiempo en zona
+                continue
+
+            if self.ultima_medicion is not None:
+                segundos = (momento - self.ultima_medicion).total_seconds()
+                if segundos <= brecha_maxima:
+                    # El intervalo se atribuye a la zona de la muestra anterior
+                    if self.ultimo_bpm >= umbral_elevado:
+                        self.segundos_zona_elevada += segundos
+                    if self.ultimo_bpm >= umbral_alto:
+                        self.segundos_zona_alta += segundos
+
+            self.ultima_medicion = momento
+            self.ultimo_bpm = bpm
+
+    def __str__(self):
+        return f"Resumen de {self.usuario_id} en sesión {self.sesion_id} ({self.n_muestras} muestras)"
+
+
+#--------------------------Umbrales de alerta de frecuencia cardíaca--------------------------------
+class UmbralesPacienteManager(models.Manager):
+    def para_paciente(self, paciente_id):
+        # Sin configuración propia se usan los valores por defecto de los campos (sin guardar)
+        return self.filter(paciente_id=paciente_id).first() or self.model(paciente_id=paciente_id)
+
+
+class UmbralesPaciente(models.Model):
+    paciente = models.OneToOneField(Usuario, on_delete=models.CASCADE, related_name='umbrales')
+    bpm_reposo = models.PositiveSmallIntegerField(default=70)
+    # Se considera elevación sostenida estar `margen_elevacion` bpm sobre el reposo durante `segundos_elevacion`
+    margen_elevacion = models.PositiveSmallIntegerField(default=30)
+    segundos_elevacion = models.PositiveSmallIntegerField(default=60)
+    bpm_maximo = models.PositiveSmallIntegerField(default=160)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    objects = UmbralesPacienteManager()
+
+    @property
+    def bpm_elevado(self):
+        return self.bpm_reposo + self.margen_elevacion
+
+    def __str__(self):
+        return f"Umbrales de {self.paciente_id} (reposo {self.bpm_reposo}, máximo {self.bpm_maximo})"
+
+
 class Suscripcion(models.Model):    
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     fecha_inicio = models.DateField()
@@ -187,4 +437,116 @@ class Room(models.Model):
     paciente = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="rooms_as_paciente")
 
     def __str__(self):
-        return f"Sala: {self.nombre} | Terapeuta: {self.terapeuta.rut} - Paciente: {self.paciente.rut}"
\ No newline at end of file
+        return f"Sala: {self.nombre} | Terapeuta: {self.terapeuta.rut} - Paciente: {self.paciente.rut}"
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class MensajeManager(models.Manager):
+    def historial(self, room_id, limite, antes=None):
+        """
+        Devuelve hasta `limite` mensajes de la sala, del más reciente al más antiguo.
+        `antes` es el cursor (fecha_envio, id) del último mensaje de la página anterior;
+        la consulta usa el índice (room, fecha_envio, id) y no depende de cuántas páginas se hayan leído.
+        """
+        mensajes = self.filter(room_id=room_id)
+        if antes is not None:
+            fecha, mensaje_id = antes
+            # fecha_envio <= fecha es redundante, pero es la condición que el planificador puede usar
+            # como inicio del recorrido del índice; el OR por sí solo obliga a partir del más reciente
+            mensajes = mensajes.filter(fecha_envio__lte=fecha).filter(
+                models.Q(fecha_envio__lt=fecha) | models.Q(fecha_envio=fecha, id__lt=mensaje_id)
+            )
+        return list(mensajes.order_by('-fecha_envio', '-id')[:limite])
+
+    def pagina(self, room_id, limite, antes=None):
+        mensajes = self.historial(room_id, limite, antes)
+        return {
+            'historial': [mensaje.como_dict() for mensaje in mensajes],
+            # Cursor para pedir la página siguiente (más antigua); None si no quedan mensajes
+            'siguiente': mensajes[-1].cursor if len(mensajes) == limite else None,
+        }
+
+
+class Mensaje(models.Model):
+    TIPO_CHOICES = [
+        (1, 'Chat'),
+        (2, 'Acción de video'),
+    ]
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="mensajes")
+    autor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True)
+    tipo = models.PositiveSmallIntegerField(choices=TIPO_CHOICES)
+    contenido = models.TextField(blank=True)  # Texto del chat
+    accion = models.CharField(max_length=10, blank=True)  # play, pause o seek
+    tiempo = models.FloatField(null=True)  # Segundo del video de la acción
+    # Se fija al recibir el mensaje, no al persistir el lote, para conservar el orden real
+    fecha_envio = models.DateTimeField(default=timezone.now)
+
+    objects = MensajeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', '-fecha_envio', '-id'], name='mensaje_room_fecha_id'),
+        ]
+
+    @property
+    def cursor(self):
+        # Opaco y seguro en una URL: base64 de "<microsegundos desde epoch>:<id>", sin relleno
+        microsegundos = (self.fecha_envio - EPOCH) // timedelta(microseconds=1)
+        return base64.urlsafe_b64encode(f"{microsegundos}:{self.id}".encode()).decode().rstrip('=')
+
+    @staticmethod
+    def leer_cursor(cursor):
+        """Devuelve (fecha_envio, id) de un cursor; ValueError si está malformado."""
+        try:
+            texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+            microsegundos, mensaje_id = texto.split(':')
+            return EPOCH + timedelta(microseconds=int(microsegundos)), int(mensaje_id)
+        except (UnicodeError, binascii.Error, OverflowError, ValueError):
+            raise ValueError(f"Cursor inválido: {cursor}") from None
+
+    def como_dict(self):
+        # Mismas claves que los mensajes en vivo del WebSocket ('message' o 'action'/'time')
+        datos = {'id': self.id, 'autor': self.autor_id, 'fecha': self.fecha_envio.isoformat()}
+        if self.tipo == 1:
+            datos['message'] = self.contenido
+        else:
+            datos['action'] = self.accion
+            datos['time'] = self.tiempo
+        return datos
+
+    def __str__(self):
+        return f"Mensaje {self.get_tipo_display()} en sala {self.room_id} ({self.fecha_envio})"
+
+
+#-----------------------------Contadores materializados del dashboard------------------------------
+class ContadorManager(models.Manager):
+    def incrementar(self, clave, delta=1, institucion_id=None):
+        if not delta:
+            return
+        if self.filter(clave=clave).update(valor=models.F('valor') + delta):
+            return
+        _, creado = self.get_or_create(clave=clave, defaults={'valor': delta, 'institucion_id': institucion_id})
+        if not creado:
+            # Otro proceso lo creó entre medio
+            self.filter(clave=clave).update(valor=models.F('valor') + delta)
+
+
+class Contador(models.Model):
+    USUARIOS_ACTIVOS = 'usuarios_activos'
+    USUARIOS_INACTIVOS = 'usuarios_inactivos'
+
+    clave = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    # Solo para los contadores de usuarios por institución (uno por institución, también con valor 0)
+    institucion = models.ForeignKey(Institucion, on_delete=models.CASCADE, null=True, blank=True)
+
+    objects = ContadorManager()
+
+    @staticmethod
+    def clave_institucion(institucion_id):
+        return f"usuarios_institucion:{institucion_id}"
+
+    def __str__(self):
+        return f"{self.clave}: {self.valor}"
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import Room
+
+#-----------------------Membresía de salas con caché en memoria---------------------------------
+# room_id -> (expira, (terapeuta_id, paciente_id) o None si la sala no existe)
+_miembros = {}
+# Consultas en curso por sala: en una tormenta de reconexiones se hace una sola consulta por sala
+_en_curso = {}
+MAXIMO_ENTRADAS = 10000
+
+
+def invalidar(room_id):
+    # Solo invalida la caché de este proceso; en los demás la entrada vence con el TTL
+    _miembros.pop(room_id, None)
+
+
+@database_sync_to_async
+def cargar_miembros(room_id):
+    return Room.objects.filter(pk=room_id).values_list('terapeuta_id', 'paciente_id').first()
+
+
+def _consulta_terminada(room_id, consulta):
+    _en_curso.pop(room_id, None)
+    if consulta.cancelled() or consulta.exception() is not None:
+        return
+    if len(_miembros) >= MAXIMO_ENTRADAS:
+        _miembros.clear()
+    _miembros[room_id] = (time.monotonic() + settings.MEMBRESIA_SALA_TTL, consulta.result())
+
+
+async def miembros_sala(room_id):
+    """Devuelve (terapeuta_id, paciente_id) de la sala, o None si no existe."""
+    entrada = _miembros.get(room_id)
+    if entrada is not None and entrada[0] > time.monotonic():
+        return entrada[1]
+
+    consulta = _en_curso.get(room_id)
+    if consulta is None:
+        consulta = asyncio.ensure_future(cargar_miembros(room_id))
+        _en_curso[room_id] = consulta
+        # La limpieza queda en la tarea y no en quien la creó: si ese socket se cancela,
+        # la consulta sigue en curso para los demás que la esperan
+        consulta.add_done_callback(lambda tarea: _consulta_terminada(room_id, tarea))
+
+    return await asyncio.shield(consulta)
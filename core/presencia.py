@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+
+#---------------------------Presencia de usuarios en las salas---------------------------------
+# Claves con TTL en la caché compartida (Redis si REDIS_URL está definido, si no memoria local).
+# Se escriben al conectarse, se renuevan con cada ping contestado y se borran al desconectarse;
+# si el worker muere sin limpiar, expiran solas al cabo de PRESENCIA_TTL segundos.
+# El valor es el channel_name de la conexión, para que al cerrar una pestaña no se borre la
+# presencia registrada por otra conexión más reciente del mismo usuario.
+def clave_sala(room_id, usuario_id):
+    return f"presencia:sala:{room_id}:{usuario_id}"
+
+
+def clave_usuario(usuario_id):
+    return f"presencia:usuario:{usuario_id}"
+
+
+async def marcar_conectado(room_id, usuario_id, canal):
+    await cache.aset_many(
+        {clave_sala(room_id, usuario_id): canal, clave_usuario(usuario_id): canal},
+        settings.PRESENCIA_TTL,
+    )
+
+
+async def marcar_desconectado(room_id, usuario_id, canal):
+    """True si la presencia en la sala era de esta conexión y se borró."""
+    claves = [clave_sala(room_id, usuario_id), clave_usuario(usuario_id)]
+    valores = await cache.aget_many(claves)
+    propias = [clave for clave in claves if valores.get(clave) == canal]
+    if propias:
+        await cache.adelete_many(propias)
+    return claves[0] in propias
+
+
+def conectados(usuario_ids):
+    """Ids de los usuarios con alguna conexión abierta, en una sola consulta a la caché."""
+    claves = {clave_usuario(usuario_id): usuario_id for usuario_id in usuario_ids}
+    return {claves[clave] for clave in cache.get_many(claves)}
+
+
+def en_sala(room_id, usuario_ids):
+    claves = {clave_sala(room_id, usuario_id): usuario_id for usuario_id in usuario_ids}
+    return {claves[clave] for clave in cache.get_many(claves)}
@@ -0,0 +1,45 @@
+from array import array
+
+
+class SuavizadorPulso:
+    """
+    Media móvil de la frecuencia cardíaca sobre un buffer circular de tamaño fijo.
+
+    Se descartan como artefactos las muestras que se alejan más de `salto_maximo` bpm de la
+    media (contacto del sensor, movimiento). Si llegan `tamano // 2` descartes seguidos se
+    asume un cambio real de nivel y el buffer se reinicia con la muestra nueva.
+    """
+
+    def __init__(self, tamano=8, salto_maximo=30):
+        self.valores = array('H', bytes(2 * tamano))
+        self.tamano = tamano
+        self.salto_maximo = salto_maximo
+        self.indice = 0
+        self.cantidad = 0
+        self.suma = 0
+        self.descartes_seguidos = 0
+
+    @property
+    def media(self):
+        return self.suma / self.cantidad if self.cantidad else None
+
+    def agregar(self, bpm):
+        """Agrega una muestra; devuelve False si se descartó como artefacto."""
+        if self.cantidad >= 3 and abs(bpm - self.media) > self.salto_maximo:
+            self.descartes_seguidos += 1
+            if self.descartes_seguidos < max(self.tamano // 2, 1):
+                return False
+            self.reiniciar()
+
+        self.descartes_seguidos = 0
+        if self.cantidad == self.tamano:
+            self.suma -= self.valores[self.indice]
+        else:
+            self.cantidad += 1
+        self.valores[self.indice] = bpm
+        self.suma += bpm
+        self.indice = (self.indice + 1) % self.tamano
+        return True
+
+    def reiniciar(self):
+        self.indice = self.cantidad = self.suma = self.descartes_seguidos = 0
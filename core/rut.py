@@ -0,0 +1,41 @@
+#--------------------------RUT chileno---------------------------------------
+# Lógica compartida por el formulario de registro (validar_rut), el modelo Usuario
+# (columna rut_normalizado) y la búsqueda de usuarios.
+
+def normalizar_rut(rut):
+    """Forma canónica para comparar y buscar: sin puntos, guiones ni espacios y con la K en mayúscula."""
+    return (rut or '').replace(".", "").replace("-", "").replace(" ", "").upper()
+
+
+def digito_verificador(numero):
+    # Cálculo del dígito verificador usando el algoritmo del Módulo 11
+    multiplicador = 2
+    suma = 0
+
+    for digito in reversed(str(numero)):
+        suma += int(digito) * multiplicador
+        multiplicador += 1
+        if multiplicador > 7:
+            multiplicador = 2
+
+    resto = 11 - (suma % 11)
+    if resto == 11:
+        return "0"
+    elif resto == 10:
+        return "K"
+    return str(resto)
+
+
+def validar_rut(rut):
+    rut = normalizar_rut(rut)
+
+    # Verificar que el RUT tenga al menos 8 caracteres (número + dígito verificador)
+    if len(rut) < 8:
+        return False
+
+    # Separar el número del dígito verificador
+    rut_numero = rut[:-1]
+    if not rut_numero.isdigit():
+        return False
+
+    return rut[-1] == digito_verificador(int(rut_numero))
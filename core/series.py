@@ -0,0 +1,95 @@
+import numpy as np
+
+from .models import SignosVitalesBloque
+
+METODOS = ('minmax', 'lttb')
+
+
+def cargar_serie(sesion_id, usuario_id):
+    """
+    Devuelve la frecuencia cardíaca de un participante de la sesión como dos arreglos de NumPy:
+    tiempos en milisegundos desde epoch (int64) y bpm (uint8), en orden cronológico.
+    Los bloques se decodifican directamente desde su representación empaquetada.
+    Es un solo usuario porque las reducciones suponen tiempos ordenados (searchsorted, reduceat).
+    """
+    bloques = SignosVitalesBloque.objects.filter(sesion_id=sesion_id, usuario_id=usuario_id)
+
+    tiempos = []
+    valores = []
+    filas = bloques.order_by('minuto').values_list('minuto', 'n_muestras', 'datos')
+    for minuto, n_muestras, datos in filas.iterator(chunk_size=500):
+        datos = bytes(datos)
+        offsets = np.frombuffer(datos, dtype='<u2', count=n_muestras)
+        tiempos.append(offsets.astype(np.int64) + int(minuto.timestamp() * 1000))
+        valores.append(np.frombuffer(datos, dtype=np.uint8, offset=2 * n_muestras, count=n_muestras))
+
+    if not tiempos:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+    return np.concatenate(tiempos), np.concatenate(valores)
+
+
+def reducir_minmax(tiempos, bpm, puntos):
+    """
+    Agrupa la serie en `puntos` intervalos de igual duración y devuelve por cada
+    intervalo no vacío su inicio, mínimo, máximo y promedio.
+    """
+    if len(tiempos) == 0:
+        return {'t': [], 'min': [], 'max': [], 'mean': []}
+
+    bordes = np.linspace(tiempos[0], tiempos[-1], puntos + 1)[:-1]
+    # Los intervalos vacíos comparten índice de inicio con el siguiente y se descartan
+    inicios = np.unique(np.searchsorted(tiempos, bordes, side='left'))
+    inicios = inicios[inicios < len(tiempos)]
+    conteos = np.diff(np.append(inicios, len(tiempos)))
+
+    return {
+        't': tiempos[inicios].tolist(),
+        'min': np.minimum.reduceat(bpm, inicios).tolist(),
+        'max': np.maximum.reduceat(bpm, inicios).tolist(),
+        'mean': np.round(np.add.reduceat(bpm.astype(np.float64), inicios) / conteos, 1).tolist(),
+    }
+
+
+def reducir_lttb(tiempos, bpm, puntos):
+    """Largest-Triangle-Three-Buckets: conserva la forma visual de la serie con `puntos` muestras."""
+    n = len(tiempos)
+    if n <= puntos or puntos < 3:
+        return {'t': tiempos.tolist(), 'bpm': bpm.tolist()}
+
+    x = tiempos.astype(np.float64)
+    y = bpm.astype(np.float64)
+    # El primer y el último punto se conservan; el resto se reparte en puntos - 2 intervalos
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(np.int64)
+    seleccion = np.empty(puntos, dtype=np.int64)
+    seleccion[0] = 0
+    seleccion[-1] = n - 1
+
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        if i + 2 < len(bordes):
+            promedio_x = x[fin:bordes[i + 2]].mean()
+            promedio_y = y[fin:bordes[i + 2]].mean()
+        else:
+            promedio_x, promedio_y = x[-1], y[-1]
+
+        areas = np.abs(
+            (x[anterior] - promedio_x) * (y[inicio:fin] - y[anterior])
+            - (x[anterior] - x[inicio:fin]) * (promedio_y - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(areas))
+        seleccion[i + 1] = anterior
+
+    return {'t': tiempos[seleccion].tolist(), 'bpm': bpm[seleccion].tolist()}
+
+
+def serie_reducida(sesion_id, usuario_id, puntos, metodo='minmax'):
+    tiempos, bpm = cargar_serie(sesion_id, usuario_id)
+    reducir = reducir_lttb if metodo == 'lttb' else reducir_minmax
+    return {
+        'sesion': sesion_id,
+        'usuario': usuario_id,
+        'metodo': metodo,
+        'n_muestras': int(len(tiempos)),
+        'serie': reducir(tiempos, bpm, puntos),
+    }
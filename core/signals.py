@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db.models.signals import pre_save, post_save, post_delete, post_init
+from django.dispatch import receiver
+
+from . import permisos_sala, versiones
+from .models import Usuario, Institucion, Contador, Room
+
+
+def contadores_habilitados():
+    return getattr(settings, 'DASHBOARD_CONTADORES_MATERIALIZADOS', False)
+
+
+def clave_estado(is_active):
+    return Contador.USUARIOS_ACTIVOS if is_active else Contador.USUARIOS_INACTIVOS
+
+
+#--------------------------Contadores del dashboard---------------------------------
+@receiver(pre_save, sender=Usuario)
+def recordar_estado_usuario(sender, instance, update_fields=None, **kwargs):
+    if not contadores_habilitados() or instance.pk is None:
+        return
+    # Guardados parciales que no tocan los campos contados (p. ej. last_login) no cuestan una consulta
+    if update_fields is not None and not {'is_active', 'institucion'} & set(update_fields):
+        return
+    instance._estado_previo = Usuario.objects.filter(pk=instance.pk).values_list('is_active', 'institucion_id').first()
+
+
+@receiver(post_save, sender=Usuario)
+def actualizar_contadores_usuario(sender, instance, created, **kwargs):
+    if not contadores_habilitados():
+        return
+
+    previo = None if created else getattr(instance, '_estado_previo', None)
+    instance._estado_previo = None
+    if not created and previo is None:
+        return
+
+    if previo is not None:
+        activo_previo, institucion_previa = previo
+        if activo_previo == instance.is_active and institucion_previa == instance.institucion_id:
+            return
+        Contador.objects.incrementar(clave_estado(activo_previo), -1)
+        if institucion_previa is not None:
+            Contador.objects.incrementar(Contador.clave_institucion(institucion_previa), -1, institucion_previa)
+
+    Contador.objects.incrementar(clave_estado(instance.is_active), 1)
+    if instance.institucion_id is not None:
+        Contador.objects.incrementar(Contador.clave_institucion(instance.institucion_id), 1, instance.institucion_id)
+
+
+@receiver(post_delete, sender=Usuario)
+def descontar_usuario(sender, instance, **kwargs):
+    if not contadores_habilitados():
+        return
+    Contador.objects.incrementar(clave_estado(instance.is_active), -1)
+    if instance.institucion_id is not None:
+        Contador.objects.incrementar(Contador.clave_institucion(instance.institucion_id), -1, instance.institucion_id)
+
+
+@receiver(post_save, sender=Institucion)
+def contar_institucion(sender, instance, created, **kwargs):
+    # Al eliminar la institución su contador se borra en cascada
+    if not contadores_habilitados() or not created:
+        return
+    Contador.objects.get_or_create(clave=Contador.clave_institucion(instance.pk), defaults={'institucion': instance})
+
+
+#--------------------------Listado de pacientes cacheado---------------------------------
+# Campos que se muestran o filtran en listarPacientes
+CAMPOS_LISTADO_PACIENTES = {'first_name', 'last_name', 'rol', 'is_active', 'institucion'}
+
+
+@receiver(post_init, sender=Usuario)
+def recordar_institucion(sender, instance, **kwargs):
+    # Para invalidar también el listado de la institución anterior si el usuario se cambia
+    instance._institucion_cargada = instance.__dict__.get('institucion_id')
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_listado_pacientes(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not CAMPOS_LISTADO_PACIENTES & set(update_fields):
+        return
+    for institucion_id in {instance.institucion_id, getattr(instance, '_institucion_cargada', None)}:
+        if institucion_id is not None:
+            versiones.renovar('pacientes', institucion_id)
+    instance._institucion_cargada = instance.institucion_id
+
+
+#--------------------------Membresía de salas---------------------------------
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidar_membresia_sala(sender, instance, **kwargs):
+    permisos_sala.invalidar(instance.pk)
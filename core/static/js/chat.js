@@ -20,8 +20,10 @@ document.addEventListener("DOMContentLoaded", function () {
 
     if (roomId) {
         const socket = new WebSocket(`wss://${window.location.host}/ws/room/${roomId}/`);
+        window.salaSocket = socket; // Compartido con main.js para enviar los signos vitales
 
         let player; // Variable global para el reproductor de YouTube
+        let estadoPendiente = null; // Estado de la sala a aplicar cuando el reproductor esté listo
 
         socket.onopen = function () {
             console.log("WebSocket conectado.");
@@ -29,6 +31,13 @@ document.addEventListener("DOMContentLoaded", function () {
 
         socket.onmessage = function (e) {
             const data = JSON.parse(e.data);
+
+            // Responder el ping del servidor; si no se responde la conexión se cierra por inactividad
+            if (data.ping !== undefined) {
+                socket.send(JSON.stringify({ pong: data.ping }));
+                return;
+            }
+
             console.log("Mensaje recibido:", data);
 
             // Cargar video si contiene un enlace de YouTube
@@ -43,6 +52,35 @@ document.addEventListener("DOMContentLoaded", function () {
             if (data.action) {
                 handleVideoAction(data.action, data.time);
             }
+
+            // Instantánea del video al conectarse tarde a la sala
+            if (data.estado && data.estado.video_id) {
+                estadoPendiente = data.estado;
+                loadVideo(data.estado.video_id);
+            }
+
+            // Entradas y salidas de la sala; el terapeuta ve si el paciente está conectado
+            if (data.presencia) {
+                mostrarPresencia(data.presencia);
+            }
+
+            // Pulso suavizado del paciente (solo llega al terapeuta)
+            if (data.pulso) {
+                const pulsoPaciente = document.getElementById("pulsoPaciente");
+                if (pulsoPaciente) {
+                    pulsoPaciente.textContent = data.pulso.bpm;
+                }
+            }
+
+            // Cambios de estado de las alertas de frecuencia cardíaca (solo llegan al terapeuta)
+            if (data.alerta) {
+                mostrarAlerta(data.alerta);
+            }
+
+            // Historial de la sala enviado al conectarse (del más reciente al más antiguo)
+            if (data.historial) {
+                mostrarHistorial(data.historial);
+            }
         };
 
         socket.onclose = function (e) {
@@ -72,6 +110,47 @@ document.addEventListener("DOMContentLoaded", function () {
             }
         };
 
+        // Muestra los mensajes de chat del historial en el contenedor de mensajes, si la página lo tiene
+        function mostrarHistorial(historial) {
+            const boxMessages = document.getElementById("boxMessages");
+            if (!boxMessages) {
+                return;
+            }
+            historial.slice().reverse().forEach(function (mensaje) {
+                if (mensaje.message) {
+                    const parrafo = document.createElement("p");
+                    parrafo.textContent = mensaje.message;
+                    boxMessages.appendChild(parrafo);
+                }
+            });
+        }
+
+        // Actualiza el indicador de presencia del paciente, si la página lo tiene
+        function mostrarPresencia(presencia) {
+            const indicador = document.getElementById("presenciaPaciente");
+            const pacienteId = document.getElementById("paciente_id");
+            if (!indicador || !pacienteId || String(presencia.usuario) !== pacienteId.value) {
+                return;
+            }
+            indicador.textContent = presencia.conectado ? "En la sala" : "Desconectado";
+            indicador.className = presencia.conectado ? "badge bg-success" : "badge bg-secondary";
+        }
+
+        // Muestra el estado de alerta del pulso del paciente, si la página lo tiene
+        function mostrarAlerta(alerta) {
+            const indicador = document.getElementById("alertaPaciente");
+            if (!indicador) {
+                return;
+            }
+            const textos = {
+                normal: "",
+                elevado: "Frecuencia cardíaca elevada sostenida (" + alerta.bpm + " bpm)",
+                maximo: "Frecuencia cardíaca sobre el máximo (" + alerta.bpm + " bpm)",
+            };
+            indicador.textContent = textos[alerta.estado] || "";
+            indicador.hidden = alerta.estado === "normal";
+        }
+
         // Función para extraer el ID de un video de YouTube
         function extractVideoId(url) {
             const match = url.match(/(?:https?:\/\/(?:www\.)?youtube\.com\/watch\?v=|youtu\.be\/)([a-zA-Z0-9_-]{11})/);
@@ -115,7 +194,18 @@ document.addEventListener("DOMContentLoaded", function () {
         function onPlayerReady(event) {
             console.log("Player listo. Reproduciendo video automáticamente.");
             event.target.unMute(); // Desactivar mute explícitamente
-            event.target.playVideo();  // Reproduce el video automáticamente cuando esté listo
+            if (estadoPendiente) {
+                // Sincroniza con la posición y el estado actuales de la sala
+                event.target.seekTo(estadoPendiente.posicion, true);
+                if (estadoPendiente.reproduciendo) {
+                    event.target.playVideo();
+                } else {
+                    event.target.pauseVideo();
+                }
+                estadoPendiente = null;
+            } else {
+                event.target.playVideo();  // Reproduce el video automáticamente cuando esté listo
+            }
 
             // Habilitar los botones de control
             if (playBtn && pauseBtn && seekBtn) {
@@ -1,3 +1,7 @@
+// Muestras pendientes de envío al servidor; se mandan en lotes para no enviar un mensaje por latido
+const muestrasPendientes = [];
+const INTERVALO_ENVIO_VITALES = 1000;
+
 async function connectToDevice() {
     try {
         const device = await navigator.bluetooth.requestDevice({
@@ -34,6 +38,21 @@ function handleHeartRateMeasurement(event) {
 
     console.log(`Frecuencia cardíaca: ${heartRate} bpm`);
     showStatusMessage(`Frecuencia cardíaca: ${heartRate} bpm`);
+    muestrasPendientes.push({ bpm: heartRate, t: Date.now() });
+}
+
+function enviarSignosVitales() {
+    const socket = window.salaSocket;
+    if (!muestrasPendientes.length || !socket || socket.readyState !== WebSocket.OPEN) {
+        return;
+    }
+    const lote = muestrasPendientes.splice(0, muestrasPendientes.length);
+    const mensaje = { vitals: lote };
+    const sesionElement = document.getElementById('sesion_id');
+    if (sesionElement && sesionElement.value) {
+        mensaje.sesion = parseInt(sesionElement.value, 10);
+    }
+    socket.send(JSON.stringify(mensaje));
 }
 
 function showStatusMessage(message) {
@@ -52,4 +71,5 @@ function handleError(error) {
 document.addEventListener('DOMContentLoaded', () => {
     const connectBtn = document.getElementById('connect-btn');
     connectBtn.addEventListener('click', connectToDevice);
+    setInterval(enviarSignosVitales, INTERVALO_ENVIO_VITALES);
 });
@@ -1,3 +1,1173 @@
-from django.test import TestCase
+import asyncio
+import io
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from collections import Counter
+from datetime import timedelta
 
-# Create your tests here.
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels_redis.core import RedisChannelLayer
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import (
+    Ciudad, Comuna, ContenidoTerapia, Contador, Institucion, Mensaje, Pais, Region, ResumenSesion, Room, SesionTerapia,
+    SignosVitalesBloque, UmbralesPaciente, Usuario, UsuarioSesion, desempaquetar_muestras, empaquetar_muestras,
+)
+
+from core import alertas, codec, conexiones, consumers, estado_sala, permisos_sala, presencia
+from core.forms import CustomUserCreationForm
+from core.escritura import BufferEscritura
+from core.limites import CoalescedorAcciones, CubetaTokens
+from core.pulso import SuavizadorPulso
+from core.routing import websocket_urlpatterns
+from inmersion.canales import capa_canales, leer_hosts
+from inmersion.registro import MuestreoPorSala
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# Para que las pruebas no dependan del Redis configurado en el entorno
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+CAPA_MEMORIA = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+# Sin el manifiesto de collectstatic las plantillas no pueden resolver {% static %}
+STORAGES_SIN_MANIFIESTO = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+#--------------------------------Tiempo de arranque de los workers--------------------------------
+class TiempoImportacionTests(SimpleTestCase):
+    # Presupuesto (ms) para importar la aplicación ASGI y el URLconf, que es lo que paga cada worker al iniciar
+    PRESUPUESTO_MS = int(os.getenv('PRESUPUESTO_IMPORTACION_MS', 2000))
+    # Módulos pesados que solo deben cargarse al usarse
+    MODULOS_DIFERIDOS = ['matplotlib']
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.acumulados = cls.medir_importacion()
+
+    @staticmethod
+    def medir_importacion():
+        resultado = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import inmersion.asgi; import inmersion.urls'],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'inmersion.settings'},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # Formato de cada línea: "import time: <propio> | <acumulado> | <módulo indentado>"
+        acumulados = {}
+        for linea in resultado.stderr.splitlines():
+            coincidencia = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)', linea)
+            if coincidencia:
+                acumulados.setdefault(coincidencia.group(4), int(coincidencia.group(2)))
+        return acumulados
+
+    def test_importacion_dentro_del_presupuesto(self):
+        total_ms = (self.acumulados['inmersion.asgi'] + self.acumulados['inmersion.urls']) / 1000
+        self.assertLess(
+            total_ms, self.PRESUPUESTO_MS,
+            f"Importar inmersion.asgi e inmersion.urls tomó {total_ms:.0f} ms (presupuesto {self.PRESUPUESTO_MS} ms)."
+        )
+
+    def test_modulos_pesados_no_se_importan_al_iniciar(self):
+        for modulo in self.MODULOS_DIFERIDOS:
+            self.assertFalse(modulo in self.acumulados, f"{modulo} se importa al iniciar el worker.")
+
+
+#--------------------------------Muestreo de registros por sala--------------------------------
+class MuestreoPorSalaTests(SimpleTestCase):
+    def registro(self, sala, tipo='vitals', nivel=logging.DEBUG):
+        registro = logging.LogRecord('core.consumers', nivel, __file__, 0, "mensaje_recibido", (), None)
+        registro.sala = sala
+        registro.tipo = tipo
+        return registro
+
+    def test_uno_de_cada_n_por_sala(self):
+        filtro = MuestreoPorSala(tipos=['vitals'], cada=10)
+        self.assertEqual(sum(filtro.filter(self.registro(1)) for _ in range(100)), 10)
+        # Otros tipos y las advertencias pasan siempre
+        self.assertTrue(all(filtro.filter(self.registro(1, tipo='message')) for _ in range(5)))
+        self.assertTrue(all(filtro.filter(self.registro(1, nivel=logging.WARNING)) for _ in range(5)))
+
+    def test_memoria_acotada_con_muchas_salas(self):
+        filtro = MuestreoPorSala(tipos=['vitals'], cada=10, ranuras=64)
+        for sala in range(10000):
+            filtro.filter(self.registro(sala))
+        self.assertEqual(len(filtro.contadores), 64)
+
+
+#--------------------------------Límite de acciones de video y agrupación de ráfagas--------------------------------
+class LimitesTests(SimpleTestCase):
+    def test_cubeta_permite_rafaga_y_se_recarga(self):
+        ahora = [100.0]
+        with mock.patch('core.limites.time.monotonic', lambda: ahora[0]):
+            cubeta = CubetaTokens(tasa=10, capacidad=5)
+            self.assertEqual([cubeta.consumir() for _ in range(6)], [True] * 5 + [False])
+            # 0,25 s a 10 tokens/s recargan 2 tokens
+            ahora[0] += 0.25
+            self.assertEqual([cubeta.consumir() for _ in range(3)], [True, True, False])
+            # Nunca acumula más que la capacidad
+            ahora[0] += 60
+            self.assertEqual(sum(cubeta.consumir() for _ in range(10)), 5)
+
+    def test_rafaga_se_reduce_al_ultimo_seek_y_play_pause(self):
+        publicadas = async_to_sync(self.rafaga)([
+            ('play', None), ('seek', 1), ('seek', 2), ('pause', None), ('seek', 3), ('play', None),
+        ])
+        # La primera sale de inmediato; al cerrar la ventana, el estado final en orden de llegada
+        self.assertEqual(publicadas, [('play', None), ('seek', 3), ('play', None)])
+
+    async def rafaga(self, acciones):
+        publicadas = []
+
+        async def publicar(accion, tiempo):
+            publicadas.append((accion, tiempo))
+
+        coalescedor = CoalescedorAcciones(publicar, ventana=0.05)
+        for accion, tiempo in acciones:
+            await coalescedor.agregar(accion, tiempo)
+        self.assertEqual(len(publicadas), 1)
+        await asyncio.sleep(0.2)
+        await coalescedor.cerrar()
+        return publicadas
+
+
+#--------------------------------Suavizado del pulso--------------------------------
+class SuavizadorPulsoTests(SimpleTestCase):
+    def test_descarta_artefactos(self):
+        suavizador = SuavizadorPulso(tamano=8, salto_maximo=30)
+        # Con menos de 3 muestras no hay media confiable y no se descarta nada
+        self.assertEqual([suavizador.agregar(bpm) for bpm in (70, 140, 72)], [True] * 3)
+        media = suavizador.media
+        self.assertEqual([suavizador.agregar(bpm) for bpm in (200, 20)], [False, False])
+        self.assertEqual(suavizador.media, media)
+        # Una muestra válida corta la racha de descartes
+        self.assertTrue(suavizador.agregar(90))
+        self.assertEqual(suavizador.descartes_seguidos, 0)
+
+    def test_se_reinicia_tras_varios_descartes_seguidos(self):
+        suavizador = SuavizadorPulso(tamano=8, salto_maximo=30)
+        for bpm in (70, 71, 72, 73):
+            suavizador.agregar(bpm)
+        # Con tamano=8, el cuarto descarte seguido se toma como un cambio real de nivel
+        self.assertEqual([suavizador.agregar(150) for _ in range(4)], [False, False, False, True])
+        self.assertEqual((suavizador.cantidad, suavizador.media), (1, 150))
+
+    def test_buffer_circular(self):
+        suavizador = SuavizadorPulso(tamano=4, salto_maximo=30)
+        for bpm in range(60, 71):
+            self.assertTrue(suavizador.agregar(bpm))
+        # Solo cuentan las últimas 4 muestras, aunque el índice dio varias vueltas
+        self.assertEqual(suavizador.cantidad, 4)
+        self.assertEqual(sorted(suavizador.valores), [67, 68, 69, 70])
+        self.assertEqual(suavizador.media, 68.5)
+
+
+#--------------------------------Alertas de frecuencia cardíaca--------------------------------
+class MotorAlertasTests(SimpleTestCase):
+    def setUp(self):
+        self.reloj = timezone.now()
+
+    def transiciones(self, motor, muestras, hz=1):
+        """[(posición de la muestra, estado nuevo)] de los cambios que informa el motor, a `hz` muestras por segundo."""
+        cambios = []
+        for i, bpm in enumerate(muestras):
+            estado = motor.evaluar(self.reloj, bpm)
+            self.reloj += timedelta(seconds=1 / hz)
+            if estado is not None:
+                cambios.append((i, estado))
+        return cambios
+
+    def test_solo_informa_los_cambios_de_estado(self):
+        # Elevado desde 100 bpm, ventana de 10 segundos, máximo 150
+        motor = alertas.MotorAlertas(UmbralesPaciente(
+            bpm_reposo=70, margen_elevacion=30, segundos_elevacion=10, bpm_maximo=150
+        ))
+        self.assertEqual(self.transiciones(motor, [70] * 9), [])
+        # La elevación sostenida necesita el 80% de la ventana sobre el umbral
+        self.assertEqual(self.transiciones(motor, [110] * 12), [(7, alertas.ELEVADO)])
+        # Sobre el máximo, y con histéresis: 148 no alcanza para salir, 140 sí
+        self.assertEqual(
+            self.transiciones(motor, [155, 148, 149, 140, 110]), [(0, alertas.MAXIMO), (3, alertas.ELEVADO)]
+        )
+        # La elevación termina cuando a lo más el 20% de la ventana sigue sobre el umbral
+        self.assertEqual(self.transiciones(motor, [70] * 12), [(7, alertas.NORMAL)])
+
+    def test_pico_aislado_no_es_elevacion_sostenida(self):
+        motor = alertas.MotorAlertas(UmbralesPaciente(segundos_elevacion=10))
+        self.assertEqual(self.transiciones(motor, ([70] * 4 + [130]) * 10), [])
+
+    def test_la_ventana_se_mide_en_segundos_y_no_en_muestras(self):
+        # A 4 Hz, 60 muestras son 15 s: la alerta recién puede salir con 60 s de elevación
+        motor = alertas.MotorAlertas(UmbralesPaciente(bpm_reposo=70, margen_elevacion=30, segundos_elevacion=60))
+        self.assertEqual(self.transiciones(motor, [130] * 240, hz=4), [])
+        self.assertEqual(self.transiciones(motor, [130], hz=4), [(0, alertas.ELEVADO)])
+
+    def test_un_hueco_vacia_la_ventana(self):
+        motor = alertas.MotorAlertas(UmbralesPaciente(segundos_elevacion=60), brecha_maxima=5.0)
+        self.assertEqual(self.transiciones(motor, [130] * 40), [])
+        # El sensor se desconecta un minuto: los 40 s anteriores no se suman a los siguientes
+        self.reloj += timedelta(minutes=1)
+        self.assertEqual(self.transiciones(motor, [130] * 60), [])
+        self.assertEqual(self.transiciones(motor, [130]), [(0, alertas.ELEVADO)])
+
+
+#--------------------------------Escritura por lotes en segundo plano--------------------------------
+class BufferEscrituraTests(SimpleTestCase):
+    def setUp(self):
+        self.lotes = []
+
+    def persistir(self, lote):
+        self.lotes.append(lote)
+
+    def test_vacia_al_llenarse(self):
+        async def escenario():
+            buffer = BufferEscritura(self.persistir, tamano_maximo=3, intervalo=60)
+            buffer.iniciar()
+            buffer.agregar([1, 2])
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.lotes, [])
+            buffer.agregar([3])
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.lotes, [[1, 2, 3]])
+            await buffer.cerrar()
+        async_to_sync(escenario)()
+
+    def test_vacia_cada_intervalo(self):
+        async def escenario():
+            buffer = BufferEscritura(self.persistir, tamano_maximo=100, intervalo=0.05)
+            buffer.iniciar()
+            buffer.agregar([1])
+            await asyncio.sleep(0.2)
+            self.assertEqual(self.lotes, [[1]])
+            await buffer.cerrar()
+        async_to_sync(escenario)()
+
+    def test_vacia_lo_pendiente_al_cerrar(self):
+        async def escenario():
+            buffer = BufferEscritura(self.persistir, tamano_maximo=100, intervalo=60)
+            buffer.iniciar()
+            buffer.agregar([1, 2])
+            await buffer.cerrar()
+        async_to_sync(escenario)()
+        self.assertEqual(self.lotes, [[1, 2]])
+
+    def test_un_error_no_detiene_los_lotes_siguientes(self):
+        def persistir(lote):
+            if not self.lotes:
+                self.lotes.append(None)
+                raise RuntimeError("base de datos no disponible")
+            self.lotes.append(lote)
+
+        async def escenario():
+            buffer = BufferEscritura(persistir, tamano_maximo=100, intervalo=60)
+            buffer.agregar([1])
+            await buffer.vaciar()
+            buffer.agregar([2])
+            await buffer.cerrar()
+
+        with self.assertLogs('core.escritura', 'ERROR') as registros:
+            async_to_sync(escenario)()
+        self.assertIn("error_persistiendo_lote elementos=1", registros.output[0])
+        self.assertEqual(self.lotes, [None, [2]])
+
+
+#--------------------------------Estado de reproducción de las salas--------------------------------
+class EstadoSalaTests(SimpleTestCase):
+    def test_posicion_extrapolada_y_pausas(self):
+        ahora = [100.0]
+        with mock.patch('core.estado_sala.time.time', lambda: ahora[0]):
+            estado = estado_sala.estado_video("miren https://youtu.be/dQw4w9WgXcQ")
+            self.assertEqual(estado['video_id'], 'dQw4w9WgXcQ')
+            self.assertEqual(estado_sala.posicion_actual(estado, 130.0), 30)
+
+            # Pausa sin tiempo: se congela en la posición proyectada
+            ahora[0] = 130.0
+            estado = estado_sala.aplicar_accion(estado, 'pause', None)
+            self.assertEqual((estado['posicion'], estado['reproduciendo']), (30, False))
+            self.assertEqual(estado_sala.posicion_actual(estado, 500.0), 30)
+
+            estado = estado_sala.aplicar_accion(estado, 'seek', 50)
+            self.assertEqual(estado_sala.posicion_actual(estado, 500.0), 50)
+
+            ahora[0] = 200.0
+            estado = estado_sala.aplicar_accion(estado, 'play', None)
+            self.assertEqual(estado_sala.posicion_actual(estado, 210.0), 60)
+            self.assertEqual(
+                estado_sala.instantanea(estado),
+                {'video_id': 'dQw4w9WgXcQ', 'posicion': 50, 'reproduciendo': True},
+            )
+
+
+#--------------------------------Membresía de salas--------------------------------
+class MembresiaSalaTests(SimpleTestCase):
+    def setUp(self):
+        permisos_sala._miembros.clear()
+        permisos_sala._en_curso.clear()
+
+    def test_cancelar_a_quien_inicio_la_consulta_no_afecta_a_los_demas(self):
+        async def escenario():
+            liberar = asyncio.Event()
+
+            async def cargar(room_id):
+                await liberar.wait()
+                return (1, 2)
+
+            with mock.patch.object(permisos_sala, 'cargar_miembros', cargar):
+                primero = asyncio.ensure_future(permisos_sala.miembros_sala(7))
+                await asyncio.sleep(0)
+                segundo = asyncio.ensure_future(permisos_sala.miembros_sala(7))
+                await asyncio.sleep(0)
+                self.assertIn(7, permisos_sala._en_curso)
+
+                # El socket que creó la consulta se cierra mientras está en vuelo
+                primero.cancel()
+                await asyncio.sleep(0)
+                liberar.set()
+                resultado = await segundo
+            self.assertTrue(primero.cancelled())
+            return resultado
+
+        self.assertEqual(async_to_sync(escenario)(), (1, 2))
+        self.assertNotIn(7, permisos_sala._en_curso)
+        self.assertEqual(permisos_sala._miembros[7][1], (1, 2))
+
+    def test_consulta_fallida_no_queda_en_curso(self):
+        async def cargar(room_id):
+            raise RuntimeError("sin base de datos")
+
+        with mock.patch.object(permisos_sala, 'cargar_miembros', cargar), self.assertRaises(RuntimeError):
+            async_to_sync(permisos_sala.miembros_sala)(7)
+        self.assertEqual((permisos_sala._en_curso, permisos_sala._miembros), ({}, {}))
+
+
+#--------------------------------Métricas de conexiones WebSocket--------------------------------
+@override_settings(WS_INTERVALO_PING=20)
+class MetricasConexionesTests(SimpleTestCase):
+    def test_vivas_e_inactivas_segun_la_ultima_actividad(self):
+        consumidores = [
+            mock.Mock(channel_name='a', room_id=1, ultima_actividad=100.0),
+            mock.Mock(channel_name='b', room_id=1, ultima_actividad=75.0),
+            mock.Mock(channel_name='c', room_id=2, ultima_actividad=60.0),
+        ]
+        with mock.patch.dict(conexiones._activas, clear=True):
+            for consumidor in consumidores:
+                conexiones.registrar(consumidor)
+            conexiones.retirar(consumidores[0])
+            conexiones.retirar(consumidores[0])
+            metricas = conexiones.metricas(ahora=100.0)
+        # Margen de 1,5 intervalos de ping (30 s): 'b' sigue viva, 'c' no
+        self.assertEqual(
+            {clave: metricas[clave] for clave in ('conexiones', 'vivas', 'inactivas', 'salas')},
+            {'conexiones': 2, 'vivas': 1, 'inactivas': 1, 'salas': 2},
+        )
+
+
+#--------------------------------Capa de canales con varios shards Redis--------------------------------
+class CapaCanalesTests(SimpleTestCase):
+    def test_configuracion_desde_variables_de_entorno(self):
+        hosts = leer_hosts(" redis://a:6379/0, redis://b:6379/0 ,")
+        self.assertEqual(hosts, ['redis://a:6379/0', 'redis://b:6379/0'])
+        capa = capa_canales(hosts, 'pubsub')
+        self.assertEqual(capa['BACKEND'], 'channels_redis.pubsub.RedisPubSubChannelLayer')
+        self.assertEqual(capa['CONFIG']['hosts'], hosts)
+        with self.assertRaises(ValueError):
+            capa_canales(hosts, 'otra')
+
+    def test_salas_repartidas_entre_shards(self):
+        shards = 4
+        capa = RedisChannelLayer(hosts=[f"redis://shard{i}:6379" for i in range(shards)])
+        reparto = Counter(capa.consistent_hash(f"room_{room_id}") for room_id in range(1, 4001))
+        self.assertEqual(set(reparto), set(range(shards)))
+        # Ningún shard debería alejarse más de un 20% del reparto ideal
+        for cantidad in reparto.values():
+            self.assertAlmostEqual(cantidad, 4000 / shards, delta=0.2 * 4000 / shards)
+        # La asignación depende solo del nombre y de la cantidad de shards, igual en todos los workers
+        otra = RedisChannelLayer(hosts=[f"redis://otro{i}:6379" for i in range(shards)])
+        self.assertEqual(capa.consistent_hash("room_42"), otra.consistent_hash("room_42"))
+
+    @unittest.skipIf(fakeredis is None, "requiere fakeredis[lua]")
+    def test_group_send_con_varios_shards(self):
+        from core.management.commands.benchmark_salas import iniciar_fakeredis
+
+        hosts = [iniciar_fakeredis() for _ in range(2)]
+        for tipo in ('redis', 'pubsub'):
+            with self.subTest(tipo=tipo):
+                config = capa_canales(hosts, tipo)
+                capa = import_string(config['BACKEND'])(**config['CONFIG'])
+                async_to_sync(self.enviar_a_salas)(capa)
+
+    async def enviar_a_salas(self, capa):
+        canales = {}
+        for room_id in range(1, 9):
+            canales[room_id] = await capa.new_channel()
+            await capa.group_add(f"room_{room_id}", canales[room_id])
+        for room_id in canales:
+            await capa.group_send(f"room_{room_id}", {'type': 'chat_message', 'texto': str(room_id)})
+        for room_id, canal in canales.items():
+            mensaje = await capa.receive(canal)
+            self.assertEqual(mensaje['texto'], str(room_id))
+        await capa.flush()
+
+
+#--------------------------------Bloques empaquetados de signos vitales--------------------------------
+@override_settings(CACHES=CACHE_LOCAL)
+class BloquesVitalesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1)
+        contenido = ContenidoTerapia.objects.create(titulo='Contenido', url_contenido='https://example.com',
+                                                    descripcion='', fecha_publicacion=timezone.now().date())
+        cls.sesion = SesionTerapia.objects.create(contenido=contenido, fecha_sesion=timezone.now(),
+                                                  duracion=60, resultado=1)
+        cls.minuto = timezone.now().replace(second=0, microsecond=0)
+
+    def test_empaquetar_y_desempaquetar(self):
+        muestras = [(0, 20), (1500, 72), (59999, 250)]
+        datos = empaquetar_muestras(muestras)
+        self.assertEqual(len(datos), 3 * len(muestras))
+        self.assertEqual(desempaquetar_muestras(datos, len(muestras)), muestras)
+
+    def test_muestras_se_agregan_al_bloque_del_minuto(self):
+        agregar = SignosVitalesBloque.objects.agregar_muestras
+        agregar(self.paciente.id, self.sesion.id, [(self.minuto + timedelta(seconds=30), 80)])
+        # Llegan desordenadas y una cae en el minuto siguiente
+        agregar(self.paciente.id, self.sesion.id, [
+            (self.minuto + timedelta(seconds=45), 90),
+            (self.minuto + timedelta(seconds=10), 70),
+            (self.minuto + timedelta(seconds=65), 100),
+        ])
+
+        bloques = list(SignosVitalesBloque.objects.order_by('minuto'))
+        self.assertEqual([bloque.minuto for bloque in bloques], [self.minuto, self.minuto + timedelta(minutes=1)])
+        self.assertEqual(bloques[0].muestras_del_minuto(), [(10000, 70), (30000, 80), (45000, 90)])
+        self.assertEqual(bloques[1].muestras_del_minuto(), [(5000, 100)])
+        self.assertEqual(
+            [bpm for _, bpm in SignosVitalesBloque.objects.muestras(self.sesion.id)], [70, 80, 90, 100]
+        )
+        self.assertEqual(ResumenSesion.objects.get(sesion=self.sesion).n_muestras, 4)
+
+    def test_otro_vaciado_crea_el_mismo_minuto(self):
+        gestor = SignosVitalesBloque.objects
+        bulk_create = gestor.bulk_create
+
+        def competir(bloques, **kwargs):
+            # Otro vaciado inserta el mismo minuto entre la lectura y la inserción de este
+            gestor.get_queryset().bulk_create([SignosVitalesBloque(
+                usuario=self.paciente, sesion=self.sesion, minuto=self.minuto,
+                n_muestras=1, datos=empaquetar_muestras([(1000, 60)]),
+            )])
+            return bulk_create(bloques, **kwargs)
+
+        with mock.patch.object(gestor, 'bulk_create', side_effect=competir):
+            gestor.agregar_muestras(self.paciente.id, self.sesion.id, [(self.minuto + timedelta(seconds=2), 61)])
+
+        bloque = SignosVitalesBloque.objects.get()
+        self.assertEqual(bloque.muestras_del_minuto(), [(1000, 60), (2000, 61)])
+        self.assertEqual(ResumenSesion.objects.get(sesion=self.sesion).n_muestras, 1)
+
+
+#--------------------------------Resumen de signos vitales por sesión--------------------------------
+@override_settings(CACHES=CACHE_LOCAL, VITALES_UMBRAL_ELEVADO=100, VITALES_UMBRAL_ALTO=120, VITALES_BRECHA_MAXIMA=5.0)
+class ResumenSesionTests(TestCase):
+    # (segundo, bpm) en tres lotes; entre 6 y 16 hay un hueco mayor a la brecha máxima
+    LOTES = [
+        [(0, 90), (2, 105), (4, 125), (6, 110)],
+        [(16, 80), (18, 100)],
+        [(20, 70), (22, 60)],
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1)
+        contenido = ContenidoTerapia.objects.create(titulo='Contenido', url_contenido='https://example.com',
+                                                    descripcion='', fecha_publicacion=timezone.now().date())
+        cls.sesion = SesionTerapia.objects.create(contenido=contenido, fecha_sesion=timezone.now(),
+                                                  duracion=60, resultado=1)
+
+    def agregar_lotes(self):
+        inicio = self.sesion.fecha_sesion.replace(second=0, microsecond=0)
+        for lote in self.LOTES:
+            SignosVitalesBloque.objects.agregar_muestras(
+                self.paciente.id, self.sesion.id, [(inicio + timedelta(seconds=s), bpm) for s, bpm in lote]
+            )
+
+    def test_estadisticas_incrementales(self):
+        self.agregar_lotes()
+        resumen = ResumenSesion.objects.get(sesion=self.sesion, usuario=self.paciente)
+        bpm = [valor for lote in self.LOTES for _, valor in lote]
+
+        self.assertEqual(resumen.n_muestras, len(bpm))
+        self.assertEqual(resumen.bpm_minimo, 60)
+        self.assertEqual(resumen.bpm_maximo, 125)
+        self.assertAlmostEqual(resumen.bpm_promedio, statistics.mean(bpm))
+        self.assertAlmostEqual(resumen.bpm_desviacion, statistics.pstdev(bpm))
+        # Cada intervalo cuenta para la zona de la muestra anterior: 2-4 (105), 4-6 (125) y 18-20 (100);
+        # el hueco de 6 a 16 no cuenta
+        self.assertEqual(resumen.segundos_zona_elevada, 6)
+        self.assertEqual(resumen.segundos_zona_alta, 2)
+
+    def test_reconstruir_reproduce_el_resumen_incremental(self):
+        self.agregar_lotes()
+        campos = [campo.name for campo in ResumenSesion._meta.concrete_fields if campo.name != 'id']
+        incremental = ResumenSesion.objects.values(*campos).get()
+
+        call_command('reconstruir_resumenes', stdout=io.StringIO())
+        self.assertEqual(ResumenSesion.objects.values(*campos).get(), incremental)
+
+
+#--------------------------------Contadores materializados del dashboard--------------------------------
+@override_settings(CACHES=CACHE_LOCAL, DASHBOARD_CONTADORES_MATERIALIZADOS=True)
+class ContadoresTests(TestCase):
+    def contadores(self):
+        # Un contador en 0 equivale a uno que no existe
+        return dict(Contador.objects.exclude(valor=0).values_list('clave', 'valor'))
+
+    def assertContadoresCorrectos(self, paso):
+        incrementales = self.contadores()
+        call_command('recalcular_contadores', stdout=io.StringIO())
+        self.assertEqual(incrementales, self.contadores(), f"Contadores distintos después de: {paso}")
+
+    def test_contadores_coinciden_con_el_recalculo(self):
+        primera = Institucion.objects.create(nombre='Primera', contacto='contacto')
+        segunda = Institucion.objects.create(nombre='Segunda', contacto='contacto')
+        self.assertContadoresCorrectos("crear instituciones")
+
+        usuario = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1, institucion=primera)
+        Usuario.objects.create(rut='4-3', email='otro@prueba.cl', rol=1)
+        self.assertContadoresCorrectos("crear usuarios")
+
+        usuario.is_active = False
+        usuario.save()
+        self.assertContadoresCorrectos("desactivar")
+
+        usuario.institucion = segunda
+        usuario.save()
+        self.assertContadoresCorrectos("cambiar de institución")
+
+        usuario.is_active = True
+        usuario.institucion = None
+        usuario.save()
+        self.assertContadoresCorrectos("reactivar y quitar la institución")
+
+        usuario.last_login = timezone.now()
+        usuario.save(update_fields=['last_login'])
+        self.assertContadoresCorrectos("guardar campos no contados")
+
+        usuario.delete()
+        self.assertContadoresCorrectos("eliminar")
+
+
+#--------------------------------Serie reducida de frecuencia cardíaca--------------------------------
+@override_settings(CACHES=CACHE_LOCAL)
+class SerieFrecuenciaCardiacaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        institucion = Institucion.objects.create(nombre='Institución de prueba', contacto='contacto')
+        cls.terapeuta = Usuario.objects.create(rut='2-7', email='terapeuta@prueba.cl', rol=2, institucion=institucion)
+        cls.paciente = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1, institucion=institucion)
+        contenido = ContenidoTerapia.objects.create(titulo='Contenido', url_contenido='https://example.com',
+                                                    descripcion='', fecha_publicacion=timezone.now().date())
+        cls.sesion = SesionTerapia.objects.create(contenido=contenido, fecha_sesion=timezone.now(),
+                                                  duracion=60, resultado=1)
+        UsuarioSesion.objects.create(usuario=cls.terapeuta, sesion=cls.sesion, rol=2)
+        UsuarioSesion.objects.create(usuario=cls.paciente, sesion=cls.sesion, rol=1)
+        # Ambos participantes registran signos vitales en los mismos minutos
+        minuto = cls.sesion.fecha_sesion.replace(second=0, microsecond=0)
+        for usuario, bpm in ((cls.paciente, 70), (cls.terapeuta, 120)):
+            SignosVitalesBloque.objects.agregar_muestras(
+                usuario.id, cls.sesion.id, [(minuto + timedelta(seconds=s), bpm) for s in range(0, 180, 5)]
+            )
+
+    def pedir(self, **parametros):
+        self.client.force_login(self.terapeuta)
+        url = reverse('serieFrecuenciaCardiaca', kwargs={'sesion_id': self.sesion.pk})
+        return self.client.get(url, {'metodo': 'lttb', 'puntos': 1000, **parametros}).json()
+
+    def test_por_defecto_la_serie_del_paciente(self):
+        datos = self.pedir()
+        self.assertEqual(datos['usuario'], self.paciente.pk)
+        self.assertEqual(set(datos['serie']['bpm']), {70})
+        self.assertEqual(datos['serie']['t'], sorted(datos['serie']['t']))
+
+    def test_serie_de_otro_participante(self):
+        datos = self.pedir(usuario=self.terapeuta.pk)
+        self.assertEqual(set(datos['serie']['bpm']), {120})
+
+    def test_terapeuta_sin_institucion(self):
+        # Ni el terapeuta ni el participante tienen institución: None no debe coincidir con None
+        terapeuta = Usuario.objects.create(rut='5-1', email='sin@prueba.cl', rol=2)
+        paciente = Usuario.objects.create(rut='6-K', email='sin-paciente@prueba.cl', rol=1)
+        UsuarioSesion.objects.create(usuario=paciente, sesion=self.sesion, rol=1)
+        self.client.force_login(terapeuta)
+        url = reverse('serieFrecuenciaCardiaca', kwargs={'sesion_id': self.sesion.pk})
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+#--------------------------------Exportación de signos vitales--------------------------------
+class ExportarSignosTests(TestCase):
+    def test_terapeuta_sin_institucion(self):
+        # El paciente tampoco tiene institución: None no debe coincidir con None
+        terapeuta = Usuario.objects.create(rut='5-1', email='sin@prueba.cl', rol=2)
+        paciente = Usuario.objects.create(rut='6-K', email='sin-paciente@prueba.cl', rol=1)
+        self.client.force_login(terapeuta)
+        url = reverse('exportarSignosPaciente', kwargs={'paciente_id': paciente.pk})
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+#--------------------------------Historial de mensajes con cursor--------------------------------
+@override_settings(CACHES=CACHE_LOCAL)
+class HistorialMensajesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.terapeuta = Usuario.objects.create(rut='2-7', email='terapeuta@prueba.cl', rol=2)
+        cls.paciente = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1)
+        cls.sala = Room.objects.create(terapeuta=cls.terapeuta, paciente=cls.paciente)
+        otra = Room.objects.create(terapeuta=cls.terapeuta, paciente=cls.paciente)
+        inicio = timezone.now()
+        # Varios mensajes comparten fecha_envio: el id desempata dentro del cursor
+        Mensaje.objects.bulk_create(
+            [Mensaje(room=cls.sala, tipo=1, contenido=f"mensaje {i}", fecha_envio=inicio + timedelta(seconds=i // 3))
+             for i in range(23)]
+            + [Mensaje(room=otra, tipo=1, contenido="otra sala", fecha_envio=inicio)]
+        )
+
+    def test_recorrer_historial_con_cursor(self):
+        self.client.force_login(self.paciente)
+        url = reverse('historialMensajes', kwargs={'room_id': self.sala.pk})
+        recibidos = []
+        antes = None
+        while True:
+            datos = self.client.get(url, {'limite': 5, **({'antes': antes} if antes else {})}).json()
+            recibidos += datos['historial']
+            antes = datos['siguiente']
+            if antes is None:
+                break
+
+        esperados = list(Mensaje.objects.filter(room=self.sala).order_by('-fecha_envio', '-id'))
+        self.assertEqual([mensaje['id'] for mensaje in recibidos], [mensaje.id for mensaje in esperados])
+        self.assertEqual(len(recibidos), 23)
+
+    def test_cursor_opaco_y_malformado(self):
+        self.client.force_login(self.paciente)
+        url = reverse('historialMensajes', kwargs={'room_id': self.sala.pk})
+        cursor = self.client.get(url, {'limite': 5}).json()['siguiente']
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        # Se puede pegar tal cual en la URL, sin codificar
+        self.assertEqual(self.client.get(f"{url}?limite=5&antes={cursor}").status_code, 200)
+        for malformado in ('x', '2026-10-18T08:00:00 00:00,5', cursor[:-3] + '!!!', 'OjE'):
+            with self.subTest(cursor=malformado):
+                self.assertEqual(self.client.get(url, {'antes': malformado}).status_code, 400)
+
+    def test_cursor_acota_el_inicio_del_indice(self):
+        ultimo = Mensaje.objects.filter(room=self.sala).order_by('fecha_envio', 'id').last()
+        with CaptureQueriesContext(connection) as consultas:
+            Mensaje.objects.historial(self.sala.pk, 5, (ultimo.fecha_envio, ultimo.id))
+        # Sin esta condición fuera del OR, PostgreSQL recorre el índice desde el mensaje más reciente
+        self.assertIn('"fecha_envio" <=', consultas.captured_queries[0]['sql'])
+
+
+#--------------------------------Listado de pacientes en caché--------------------------------
+@override_settings(CACHES=CACHE_LOCAL, STORAGES=STORAGES_SIN_MANIFIESTO)
+class ListadoPacientesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.institucion = Institucion.objects.create(nombre='Institución de prueba', contacto='contacto')
+        cls.terapeuta = Usuario.objects.create(rut='2-7', email='terapeuta@prueba.cl', rol=2,
+                                               institucion=cls.institucion)
+        Usuario.objects.bulk_create([
+            Usuario(rut=f"P{i}", email=f"p{i}@prueba.cl", rol=1, last_name=f"{i:03}", institucion=cls.institucion)
+            for i in range(60)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.terapeuta)
+
+    def test_con_cache_caliente_solo_sesion_y_usuario(self):
+        url = reverse('listarPacientes')
+        self.client.get(url, {'pagina': 2})
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url, {'pagina': 2})
+        self.assertEqual(len(consultas), 2, "\n".join(consulta['sql'] for consulta in consultas.captured_queries))
+        self.assertEqual(len(respuesta.context['pagina']['pacientes']), 10)
+        self.assertContains(respuesta, "Página 2 de 2")
+
+    def test_un_paciente_nuevo_invalida_el_listado(self):
+        url = reverse('listarPacientes')
+        self.client.get(url)
+        Usuario.objects.create(rut='4-3', email='nuevo@prueba.cl', rol=1, last_name='000',
+                               institucion=self.institucion)
+        self.assertEqual(self.client.get(url).context['pagina']['pacientes'][0]['last_name'], '000')
+
+    def test_terapeuta_sin_institucion(self):
+        # Sin la guarda vería a los pacientes sin institución, cacheados bajo 'pacientes:None'
+        Usuario.objects.create(rut='5-1', email='suelto@prueba.cl', rol=1)
+        sin_institucion = Usuario.objects.create(rut='4-3', email='sin@prueba.cl', rol=2)
+        self.client.force_login(sin_institucion)
+        self.assertEqual(self.client.get(reverse('listarPacientes')).status_code, 403)
+
+
+#--------------------------------RUT normalizado único--------------------------------
+@override_settings(CACHES=CACHE_LOCAL)
+class RutNormalizadoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Usuario.objects.create(rut='12345678-5', email='existente@prueba.cl', rol=1)
+
+    def test_mismo_rut_en_otro_formato_es_duplicado(self):
+        formulario = CustomUserCreationForm(data={
+            'rut': '12.345.678-5', 'email': 'otro@prueba.cl', 'rol': 1,
+            'password1': 'UnaClave-Segura-123', 'password2': 'UnaClave-Segura-123',
+        })
+        self.assertFalse(formulario.is_valid())
+        self.assertIn('rut', formulario.errors)
+        with self.assertRaises(IntegrityError):
+            Usuario.objects.create(rut='12.345.678-5', email='otro@prueba.cl', rol=1)
+
+    def test_importacion_rechaza_ruts_en_otro_formato(self):
+        filas = [
+            "rut,email",
+            "12.345.678-5,a@prueba.cl",  # ya existe como 12345678-5
+            "11111111-1,b@prueba.cl",
+            "11.111.111-1,c@prueba.cl",  # repetido en el archivo
+            "22222222-2,d@prueba.cl",
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as archivo:
+            archivo.write("\n".join(filas))
+        self.addCleanup(os.remove, archivo.name)
+
+        salida, errores = io.StringIO(), io.StringIO()
+        call_command('import_usuarios', archivo.name, '--simular', '--procesos', '1', stdout=salida, stderr=errores)
+        self.assertIn("Se validarían 2 usuarios", salida.getvalue())
+        self.assertIn("Línea 2 (12.345.678-5): Ya existe un usuario con este RUT.", errores.getvalue())
+        self.assertIn("Línea 4 (11.111.111-1): RUT repetido en el archivo.", errores.getvalue())
+
+    def test_autocompletar_para_terapeuta_sin_institucion(self):
+        # El usuario existente tampoco tiene institución: None no debe coincidir con None
+        terapeuta = Usuario.objects.create(rut='2-7', email='terapeuta@prueba.cl', rol=2)
+        self.client.force_login(terapeuta)
+        respuesta = self.client.get(reverse('autocompletarUsuarios'), {'q': '1234'})
+        self.assertEqual(respuesta.status_code, 403)
+
+
+#--------------------------------Consultas SQL y tiempo por vista--------------------------------
+# Caché local: con el REDIS_URL del entorno cada Usuario.save() intentaría conectarse a ese Redis
+@override_settings(CACHES=CACHE_LOCAL, STORAGES=STORAGES_SIN_MANIFIESTO)
+class ConsultasPorVistaTests(TestCase):
+    # Cantidad de pacientes, mensajes, minutos de signos vitales, instituciones y comunas de cada escala.
+    # El máximo de consultas de cada vista no debe crecer con la escala (sin N+1).
+    ESCALAS = [int(escala) for escala in os.getenv('ESCALAS_CONSULTAS', '1,20,200').split(',')]
+    PRESUPUESTO_VISTA_MS = int(os.getenv('PRESUPUESTO_VISTA_MS', 1000))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.institucion = Institucion.objects.create(nombre='Institución de prueba', contacto='contacto')
+        cls.admin = Usuario.objects.create(rut='1-9', email='admin@prueba.cl', rol=3, is_staff=True,
+                                           institucion=cls.institucion)
+        cls.terapeuta = Usuario.objects.create(rut='2-7', email='terapeuta@prueba.cl', rol=2,
+                                               institucion=cls.institucion)
+        cls.paciente = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1,
+                                              institucion=cls.institucion)
+        cls.sala = Room.objects.create(terapeuta=cls.terapeuta, paciente=cls.paciente)
+        contenido = ContenidoTerapia.objects.create(titulo='Contenido', url_contenido='https://example.com',
+                                                    descripcion='', fecha_publicacion=timezone.now().date())
+        cls.sesion = SesionTerapia.objects.create(contenido=contenido, fecha_sesion=timezone.now(),
+                                                  duracion=60, resultado=1)
+        UsuarioSesion.objects.create(usuario=cls.paciente, sesion=cls.sesion, rol=1)
+        cls.poblados = 0
+
+    def poblar(self, escala):
+        """Agrega los datos que faltan para llegar a `escala` elementos de cada tipo."""
+        nuevos = range(self.poblados, escala)
+        # Opciones de los selectores del formulario de institución
+        for i in nuevos:
+            pais = Pais.objects.create(nombre_pais=f"País {i}")
+            region = Region.objects.create(nombre_region=f"Región {i}", pais=pais)
+            ciudad = Ciudad.objects.create(nombre_ciudad=f"Ciudad {i}", region=region)
+            Comuna.objects.create(nombre_comuna=f"Comuna {i}", ciudad=ciudad)
+        instituciones = Institucion.objects.bulk_create(
+            [Institucion(nombre=f"Institución {i}", contacto='contacto') for i in nuevos]
+        )
+        Usuario.objects.bulk_create(
+            [Usuario(rut=f"P{i}", email=f"p{i}@prueba.cl", rol=1, first_name='Paciente', last_name=f"{i:05}",
+                     institucion=self.institucion) for i in nuevos]
+            + [Usuario(rut=f"U{i}", email=f"u{i}@prueba.cl", rol=1, is_active=i % 2 == 0, institucion=institucion)
+               for i, institucion in zip(nuevos, instituciones)]
+        )
+        Mensaje.objects.bulk_create(
+            [Mensaje(room=self.sala, autor=self.terapeuta, tipo=1, contenido=f"mensaje {i}") for i in nuevos]
+        )
+        inicio = self.sesion.fecha_sesion
+        SignosVitalesBloque.objects.agregar_muestras(
+            self.paciente.id, self.sesion.id,
+            [(inicio + timedelta(seconds=60 * i + s), 60 + (i + s) % 60) for i in nuevos for s in range(30)],
+        )
+        self.poblados = max(self.poblados, escala)
+
+    def rutas(self):
+        # (ruta, usuario, kwargs, parámetros GET, estado esperado, máximo de consultas)
+        return [
+            ('home', None, {}, {}, 200, 0),
+            ('login', None, {}, {}, 200, 0),
+            ('exit', self.paciente, {}, {}, 302, 4),
+            ('register', self.admin, {}, {}, 200, 3),
+            ('institucion', self.admin, {}, {}, 200, 6),
+            ('editarUsuario', self.admin, {'pk': self.paciente.pk}, {}, 200, 5),
+            ('buscadorUsuario', self.admin, {}, {}, 200, 2),
+            ('autocompletarUsuarios', self.admin, {}, {'q': '12'}, 200, 4),
+            ('autocompletarUsuarios', self.terapeuta, {}, {'q': 'pacien'}, 200, 4),
+            ('dashboard', self.admin, {}, {}, 200, 4),
+            ('dashboardGrafico', self.admin, {}, {}, 200, 3),
+            ('dashboardConexiones', self.admin, {}, {}, 200, 2),
+            ('listarPacientes', self.terapeuta, {}, {}, 200, 4),
+            ('chatPaciente', self.terapeuta, {'paciente_id': self.paciente.pk}, {}, 200, 4),
+            ('metricasChat', self.terapeuta, {}, {}, 200, 2),
+            ('fichaPaciente', self.terapeuta, {}, {}, 200, 2),
+            ('serieFrecuenciaCardiaca', self.terapeuta, {'sesion_id': self.sesion.pk}, {}, 200, 5),
+            ('historialMensajes', self.terapeuta, {'room_id': self.sala.pk}, {'limite': 50}, 200, 4),
+            ('miChat', self.paciente, {}, {}, 200, 3),
+            ('exportarSignosPaciente', self.terapeuta, {'paciente_id': self.paciente.pk}, {}, 200, 4),
+            ('exportarSignosInstitucion', self.admin, {}, {'gzip': 1}, 200, 3),
+        ]
+
+    def pedir(self, ruta, usuario, kwargs, parametros):
+        self.client.logout()
+        if usuario is not None:
+            self.client.force_login(usuario)
+        return self.client.get(reverse(ruta, kwargs=kwargs), parametros)
+
+    def test_consultas_y_tiempo_por_vista(self):
+        for escala in self.ESCALAS:
+            self.poblar(escala)
+            for ruta, usuario, kwargs, parametros, estado, maximo in self.rutas():
+                with self.subTest(escala=escala, ruta=ruta):
+                    # Primera petición sin medir: importaciones diferidas y plantillas compiladas
+                    self.pedir(ruta, usuario, kwargs, parametros)
+                    # Se mide con la caché vacía, que es el peor caso
+                    cache.clear()
+                    self.client.logout()
+                    if usuario is not None:
+                        self.client.force_login(usuario)
+                    url = reverse(ruta, kwargs=kwargs)
+                    with CaptureQueriesContext(connection) as consultas:
+                        inicio = time.perf_counter()
+                        respuesta = self.client.get(url, parametros)
+                        if respuesta.streaming:
+                            # Las consultas de una descarga ocurren al recorrer su contenido
+                            b''.join(respuesta.streaming_content)
+                        milisegundos = (time.perf_counter() - inicio) * 1000
+
+                    self.assertEqual(respuesta.status_code, estado)
+                    self.assertLessEqual(
+                        len(consultas), maximo,
+                        f"{ruta} hizo {len(consultas)} consultas con escala {escala} (máximo {maximo}):\n"
+                        + "\n".join(consulta['sql'] for consulta in consultas.captured_queries)
+                    )
+                    self.assertLess(
+                        milisegundos, self.PRESUPUESTO_VISTA_MS,
+                        f"{ruta} tomó {milisegundos:.0f} ms con escala {escala} (presupuesto {self.PRESUPUESTO_VISTA_MS} ms)."
+                    )
+
+
+#--------------------------------Consumidor de las salas (WebSocket)--------------------------------
+@override_settings(CACHES=CACHE_LOCAL, CHANNEL_LAYERS=CAPA_MEMORIA)
+class ConsumidorSalaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.terapeuta = Usuario.objects.create(rut='2-7', email='terapeuta@prueba.cl', rol=2)
+        cls.paciente = Usuario.objects.create(rut='3-5', email='paciente@prueba.cl', rol=1)
+        cls.sala = Room.objects.create(terapeuta=cls.terapeuta, paciente=cls.paciente)
+
+    def setUp(self):
+        cache.clear()
+        # La membresía se cachea por proceso y los id de sala se reutilizan entre pruebas
+        permisos_sala._miembros.clear()
+
+    async def conectar(self, usuario, room_id=None, subprotocolos=None):
+        comunicador = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/room/{room_id or self.sala.pk}/", subprotocols=subprotocolos
+        )
+        comunicador.scope['user'] = usuario
+        conectado, codigo = await comunicador.connect()
+        return comunicador, conectado, codigo
+
+    async def resultado_conexion(self, usuario, room_id=None):
+        """True si la conexión fue aceptada; si no, el código de cierre."""
+        comunicador, conectado, codigo = await self.conectar(usuario, room_id)
+        if not conectado:
+            return codigo
+        await comunicador.disconnect()
+        return True
+
+    def test_solo_los_miembros_pueden_conectarse(self):
+        otro = Usuario.objects.create(rut='4-3', email='otro@prueba.cl', rol=1)
+        casos = [
+            ('terapeuta', self.terapeuta, None, True),
+            ('paciente', self.paciente, None, True),
+            ('no miembro', otro, None, 4403),
+            ('anónimo', AnonymousUser(), None, 4403),
+            ('sala inexistente', self.terapeuta, self.sala.pk + 1000, 4403),
+        ]
+        for caso, usuario, room_id, esperado in casos:
+            with self.subTest(caso):
+                self.assertEqual(async_to_sync(self.resultado_conexion)(usuario, room_id), esperado)
+
+    def test_cambios_en_la_sala_invalidan_la_membresia(self):
+        nuevo = Usuario.objects.create(rut='4-3', email='nuevo@prueba.cl', rol=1)
+        conectar = async_to_sync(self.resultado_conexion)
+        self.assertTrue(conectar(self.paciente))
+        self.assertIn(self.sala.pk, permisos_sala._miembros)
+
+        # Sin la invalidación, la membresía cacheada seguiría aceptando al paciente anterior hasta el TTL
+        self.sala.paciente = nuevo
+        self.sala.save()
+        self.assertNotIn(self.sala.pk, permisos_sala._miembros)
+        self.assertEqual(conectar(self.paciente), 4403)
+        self.assertTrue(conectar(nuevo))
+
+        room_id = self.sala.pk
+        self.sala.delete()
+        self.assertNotIn(room_id, permisos_sala._miembros)
+        self.assertEqual(conectar(nuevo, room_id), 4403)
+
+    def test_marca_de_tiempo_fuera_de_rango(self):
+        ahora_ms = timezone.now().timestamp() * 1000
+        self.assertEqual(len(consumers.parsear_muestras([{'bpm': 70, 't': ahora_ms}, 72])), 2)
+        for t in (1e20, -1e20, float('inf'), float('nan'), 0, ahora_ms + 3600 * 1000):
+            with self.subTest(t=t), self.assertRaises(ValueError):
+                consumers.parsear_muestras({'bpm': 70, 't': t})
+
+    def test_sesion_de_vitales_se_busca_una_vez_por_conexion(self):
+        # El paciente no participa en ninguna sesión: las muestras no se guardan y no se vuelve a consultar
+        with mock.patch.object(consumers, 'resolver_sesion', wraps=consumers.resolver_sesion) as resolver:
+            async_to_sync(self.enviar_vitales)(3)
+        self.assertEqual(resolver.call_count, 1)
+        self.assertFalse(SignosVitalesBloque.objects.exists())
+
+    def test_sesion_invalida_se_informa_una_vez(self):
+        with mock.patch.object(consumers, 'resolver_sesion', wraps=consumers.resolver_sesion) as resolver, \
+                self.assertLogs('core.consumers', 'WARNING') as registros:
+            async_to_sync(self.enviar_vitales)(3, sesion='abc')
+        self.assertEqual(resolver.call_count, 0)
+        self.assertEqual(sum('Sesión inválida' in linea for linea in registros.output), 1)
+
+    async def enviar_vitales(self, tramas, **extra):
+        comunicador, conectado, _ = await self.conectar(self.paciente)
+        self.assertTrue(conectado)
+        for _ in range(tramas):
+            await comunicador.send_json_to({'vitals': [{'bpm': 70}], **extra})
+        await comunicador.receive_nothing(timeout=0.2)
+        await comunicador.disconnect()
+
+    def test_eventos_en_json_y_msgpack_segun_el_subprotocolo(self):
+        eventos = []
+        group_send = InMemoryChannelLayer.group_send
+
+        async def registrar(capa, grupo, mensaje):
+            eventos.append(mensaje)
+            await group_send(capa, grupo, mensaje)
+
+        with mock.patch.object(InMemoryChannelLayer, 'group_send', registrar):
+            binario, texto = async_to_sync(self.difundir_accion)()
+        self.assertEqual(codec.decodificar(bytes_data=binario), {'action': 'seek', 'time': 12.5})
+        self.assertEqual(codec.decodificar(texto), {'action': 'seek', 'time': 12.5})
+        # El evento viaja por la capa de canales en un solo formato; el suscriptor binario lo empaqueta
+        evento = next(evento for evento in eventos if evento['type'] == 'video_action')
+        self.assertEqual(set(evento), {'type', 'texto'})
+
+    async def difundir_accion(self):
+        terapeuta, conectado, _ = await self.conectar(self.terapeuta, subprotocolos=[codec.SUBPROTOCOLO_BINARIO])
+        self.assertTrue(conectado)
+        paciente, conectado, _ = await self.conectar(self.paciente)
+        self.assertTrue(conectado)
+        await self.descartar_hasta(terapeuta, 'presencia', binario=True)
+        await self.descartar_hasta(paciente, 'historial')
+
+        await paciente.send_json_to({'action': 'seek', 'time': 12.5})
+        binario = await self.descartar_hasta(terapeuta, 'action', binario=True)
+        texto = await self.descartar_hasta(paciente, 'action')
+        await terapeuta.disconnect()
+        await paciente.disconnect()
+        return binario, texto
+
+    async def descartar_hasta(self, comunicador, clave, binario=False):
+        """Devuelve la primera trama (sin decodificar) que contiene `clave`, descartando las anteriores."""
+        while True:
+            trama = await comunicador.receive_output(timeout=1)
+            datos = trama.get('bytes') if binario and trama.get('bytes') is not None else trama.get('text')
+            if clave in codec.decodificar(*((None, datos) if isinstance(datos, bytes) else (datos, None))):
+                return datos
+
+    def test_quien_llega_tarde_recibe_la_instantanea(self):
+        estado = async_to_sync(self.llegar_tarde)()
+        self.assertEqual(estado, {'video_id': 'dQw4w9WgXcQ', 'posicion': 42.0, 'reproduciendo': False})
+
+    async def llegar_tarde(self):
+        terapeuta, conectado, _ = await self.conectar(self.terapeuta)
+        self.assertTrue(conectado)
+        await terapeuta.send_json_to({'message': "https://www.youtube.com/watch?v=dQw4w9WgXcQ"})
+        await self.descartar_hasta(terapeuta, 'message')
+        await terapeuta.send_json_to({'action': 'pause', 'time': 42})
+        await self.descartar_hasta(terapeuta, 'action')
+
+        paciente, conectado, _ = await self.conectar(self.paciente)
+        self.assertTrue(conectado)
+        estado = codec.decodificar(await self.descartar_hasta(paciente, 'estado'))['estado']
+        await paciente.disconnect()
+        await terapeuta.disconnect()
+        return estado
+
+    @override_settings(WS_TASA_MENSAJES=0.001, WS_RAFAGA_MENSAJES=1)
+    def test_el_limite_solo_descarta_acciones_de_video(self):
+        with self.assertLogs('core.consumers', 'WARNING') as registros:
+            recibidos = async_to_sync(self.inundar)()
+        self.assertEqual(recibidos, ['uno', 'dos', 'tres'])
+        self.assertEqual(sum('limite_mensajes_excedido' in linea for linea in registros.output), 1)
+
+    async def inundar(self):
+        terapeuta, conectado, _ = await self.conectar(self.terapeuta)
+        self.assertTrue(conectado)
+        paciente, conectado, _ = await self.conectar(self.paciente)
+        self.assertTrue(conectado)
+        await self.descartar_hasta(paciente, 'historial')
+
+        # La cubeta se agota con la primera acción; el chat que sigue se reenvía igual
+        for tiempo in (1, 2, 3):
+            await terapeuta.send_json_to({'action': 'seek', 'time': tiempo})
+        recibidos = []
+        for texto in ('uno', 'dos', 'tres'):
+            await terapeuta.send_json_to({'message': texto})
+            recibidos.append(codec.desde_json(await self.descartar_hasta(paciente, 'message'))['message'])
+        await paciente.disconnect()
+        await terapeuta.disconnect()
+        return recibidos
+
+    @override_settings(WS_INTERVALO_PING=0.05, WS_TIEMPO_INACTIVIDAD=0.2)
+    def test_cierra_las_conexiones_que_no_contestan_el_ping(self):
+        cerradas = conexiones.metricas()['cerradas_por_inactividad']
+        codigo, metricas = async_to_sync(self.dejar_inactivo)()
+        self.assertEqual(codigo, 4408)
+        self.assertEqual(metricas['cerradas_por_inactividad'], cerradas + 1)
+        # Solo queda registrado el paciente, que sí contesta
+        self.assertEqual((metricas['conexiones'], metricas['vivas']), (1, 1))
+
+    async def dejar_inactivo(self):
+        terapeuta, conectado, _ = await self.conectar(self.terapeuta)
+        self.assertTrue(conectado)
+        paciente, conectado, _ = await self.conectar(self.paciente)
+        self.assertTrue(conectado)
+
+        async def contestar():
+            while True:
+                ping = codec.desde_json(await self.descartar_hasta(paciente, 'ping'))['ping']
+                await paciente.send_json_to({'pong': ping})
+
+        respuestas = asyncio.ensure_future(contestar())
+        try:
+            # El terapeuta no contesta: recibe pings hasta que el servidor cierra
+            trama = await terapeuta.receive_output(timeout=2)
+            while trama['type'] != 'websocket.close':
+                trama = await terapeuta.receive_output(timeout=2)
+            metricas = conexiones.metricas()
+        finally:
+            respuestas.cancel()
+        await terapeuta.disconnect()
+        await paciente.disconnect()
+        return trama.get('code'), metricas
+
+    def test_presencia_con_varias_conexiones_del_mismo_usuario(self):
+        anuncios, en_sala = async_to_sync(self.abrir_pestanas)()
+        # Cerrar una pestaña que no registró la presencia no anuncia nada; cerrar la que sí la
+        # registró anuncia la salida y otra pestaña abierta la reclama de inmediato
+        self.assertEqual(anuncios, {'ajena': [], 'propia': [False, True]})
+        self.assertEqual(en_sala, {'ajena': True, 'propia': True})
+
+    async def abrir_pestanas(self):
+        terapeuta, conectado, _ = await self.conectar(self.terapeuta)
+        self.assertTrue(conectado)
+        # La presencia queda registrada a nombre de la última conexión del paciente
+        pestanas = []
+        for _ in range(3):
+            pestana, conectado, _ = await self.conectar(self.paciente)
+            self.assertTrue(conectado)
+            pestanas.append(pestana)
+        while not await terapeuta.receive_nothing(timeout=0.1):
+            await terapeuta.receive_output()
+
+        async def cerrar(pestana):
+            await pestana.disconnect()
+            anuncios = []
+            while not await terapeuta.receive_nothing(timeout=0.1):
+                datos = codec.desde_json(await terapeuta.receive_from())
+                if datos.get('presencia', {}).get('usuario') == self.paciente.pk:
+                    anuncios.append(datos['presencia']['conectado'])
+            return anuncios, bool(presencia.en_sala(self.sala.pk, [self.paciente.pk]))
+
+        anuncios, en_sala = {}, {}
+        anuncios['ajena'], en_sala['ajena'] = await cerrar(pestanas[0])
+        anuncios['propia'], en_sala['propia'] = await cerrar(pestanas[2])
+        await pestanas[1].disconnect()
+        await terapeuta.disconnect()
+        return anuncios, en_sala
+
+    @override_settings(VITALES_INTERVALO_RELEVO=1.0)
+    def test_pulso_se_reenvia_al_terapeuta_una_vez_por_intervalo(self):
+        ahora = [1000.0]
+        with mock.patch.object(consumers, 'monotonic', lambda: ahora[0]):
+            relevados = async_to_sync(self.relevar_pulso)(ahora)
+        # 70 sale de inmediato, 71-73 caen dentro del intervalo y 74 sale con la media de las cinco
+        self.assertEqual(relevados, [70, 72])
+
+    async def relevar_pulso(self, ahora):
+        terapeuta, conectado, _ = await self.conectar(self.terapeuta)
+        self.assertTrue(conectado)
+        paciente, conectado, _ = await self.conectar(self.paciente)
+        self.assertTrue(conectado)
+
+        async def pulso():
+            return codec.desde_json(await self.descartar_hasta(terapeuta, 'pulso'))['pulso']['bpm']
+
+        relevados = []
+        await paciente.send_json_to({'vitals': [{'bpm': 70}]})
+        relevados.append(await pulso())
+        ahora[0] += 0.5
+        for bpm in (71, 72, 73):
+            await paciente.send_json_to({'vitals': [{'bpm': bpm}]})
+        # Dentro del intervalo el terapeuta no recibe nada
+        self.assertTrue(await terapeuta.receive_nothing(timeout=0.1))
+        ahora[0] += 0.5
+        await paciente.send_json_to({'vitals': [{'bpm': 74}]})
+        relevados.append(await pulso())
+        self.assertTrue(await terapeuta.receive_nothing(timeout=0.1))
+
+        await paciente.disconnect()
+        await terapeuta.disconnect()
+        return relevados
@@ -0,0 +1,20 @@
+import time
+
+from django.core.cache import cache
+
+
+#---------------------------Versiones para invalidar datos cacheados---------------------------------
+# Las claves de caché (datos o fragmentos de plantilla) incluyen la versión; al cambiar los datos se
+# asigna una versión nueva y las entradas anteriores simplemente dejan de leerse hasta expirar.
+# Se usa la hora en nanosegundos y no un contador para que, si la caché descarta la clave, la
+# versión regenerada no coincida con la de una entrada vieja.
+def clave_version(nombre, objeto_id):
+    return f"version:{nombre}:{objeto_id}"
+
+
+def version(nombre, objeto_id):
+    return cache.get_or_set(clave_version(nombre, objeto_id), time.time_ns, None)
+
+
+def renovar(nombre, objeto_id):
+    cache.set(clave_version(nombre, objeto_id), time.time_ns(), None)
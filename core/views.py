@@ -6,21 +6,30 @@ from django.contrib.auth.views import LoginView
 from django.urls import reverse_lazy
 from django.core.exceptions import PermissionDenied
 from django.views.generic.edit import UpdateView
-from django.views.generic import TemplateView
-from django.http import HttpResponseForbidden
-import matplotlib.pyplot as plt
-import base64
-from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')
+from django.views.generic import TemplateView, View
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, HttpResponseBadRequest
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.cache import patch_cache_control
 import json
-from django.db.models import Count
+import logging
+from django.db.models import Count, Q, F
+from django.conf import settings
 
+from . import conexiones, presencia, versiones
 from .models import (
     Usuario,
     Room,
     Institucion,
+    Contador,
+    Mensaje,
+    SesionTerapia,
+    SignosVitalesBloque,
+    UsuarioSesion,
 )
+from .busqueda import buscar_usuarios
+from .exportacion import ENCABEZADO_SIGNOS_VITALES, filas_signos_vitales, respuesta_csv
+from .rut import normalizar_rut
 
 from .forms import (
     CustomUserCreationForm,
@@ -31,6 +40,8 @@ from .forms import (
 )
 from .models import Usuario, Direccion
 
+logger = logging.getLogger(__name__)
+
 # Decorators to enforce role-based access
 def role_required(role_id):
     def decorator(view_func):
@@ -74,9 +85,7 @@ class UsuarioUpdateView(LoginRequiredMixin, UpdateView):
         usuario_actual = self.get_object()  # Usuario que se está editando
         form.rol_usuario = usuario_actual.rol
 
-        # Agrega esto para depurar
-        print("Usuario autenticado en la sesión:", self.request.user)
-        print("Usuario que se está editando:", usuario_actual)
+        logger.debug("editar_usuario sesion=%s editado=%s", self.request.user.pk, usuario_actual.pk)
 
         return form
 
@@ -137,8 +146,9 @@ def buscarUsuario(request):
     form = BuscarUsuarioForm(request.POST or None)
     
     if form.is_valid():
-        rut = form.cleaned_data['rut']
-        usuario = Usuario.objects.filter(rut=rut).first()
+        # Se compara sin formato para que "12.345.678-5" encuentre a "12345678-5"
+        rut = normalizar_rut(form.cleaned_data['rut'])
+        usuario = Usuario.objects.filter(rut_normalizado=rut).first()
         
         if usuario:
             return redirect('editarUsuario', pk=usuario.pk)
@@ -146,9 +156,29 @@ def buscarUsuario(request):
             form.add_error('rut', 'Usuario no encontrado.')
     
     return render(request, 'core/buscadorUsuario.html', {'form': form})
+
+AUTOCOMPLETAR_LIMITE = 10
+
+@login_required
+def autocompletarUsuarios(request):
+    if request.user.rol not in [3, 4, 2]:
+        raise PermissionDenied
+
+    usuarios = Usuario.objects.all()
+    # Los terapeutas solo ven usuarios de su institución; sin institución no ven a nadie
+    if request.user.rol == 2:
+        if request.user.institucion_id is None:
+            raise PermissionDenied
+        usuarios = usuarios.filter(institucion_id=request.user.institucion_id)
+
+    resultados = buscar_usuarios(request.GET.get('q', ''), AUTOCOMPLETAR_LIMITE, usuarios)
+    return JsonResponse({'resultados': resultados})
 #----------------------------------------------------------------------------------------------------------------------
 
 #---------------------------------------Vistas específicas para terapeutas---------------------------------------------
+PACIENTES_POR_PAGINA = 50
+DURACION_CACHE_PACIENTES = 10 * 60
+
 @login_required
 @terapeuta_required
 def listarPacientes(request):
@@ -156,13 +186,44 @@ def listarPacientes(request):
     if not isinstance(terapeuta, Usuario) or terapeuta.rol != 2:  # Verificar si es terapeuta
         return redirect('error_page')  # Redirigir a una página de error o inicio
 
-    # Obtener la institución del terapeuta
-    institucion_id = terapeuta.institucion.id
-
-    # Filtrar pacientes de la misma institución
-    pacientes = Usuario.objects.filter(institucion_id=institucion_id, rol=1)  # Asumiendo 1 es el rol de Paciente
-
-    return render(request, 'terapeuta/listarPacientes.html', {'pacientes': pacientes})
+    # La institución se toma de la columna del usuario, sin consultar la tabla de instituciones
+    institucion_id = terapeuta.institucion_id
+    if institucion_id is None:
+        # Sin institución no hay pacientes que listar (y no se cachea bajo 'pacientes:None')
+        raise PermissionDenied
+    try:
+        numero = int(request.GET.get('pagina', 1))
+    except ValueError:
+        numero = 1
+
+    # La página (ids, nombres y paginación) se cachea por institución y versión: con la caché caliente
+    # la vista no consulta la base de datos más allá de la sesión y el usuario
+    clave = f"pacientes:{institucion_id}:{versiones.version('pacientes', institucion_id)}:{numero}"
+    pagina = cache.get_or_set(clave, lambda: pagina_pacientes(institucion_id, numero), DURACION_CACHE_PACIENTES)
+
+    # El estado en línea cambia a cada rato y no se cachea; se calcula con los ids ya cacheados
+    conectados = sorted(presencia.conectados([paciente['id'] for paciente in pagina['pacientes']]))
+
+    return render(request, 'terapeuta/listarPacientes.html', {
+        'pagina': pagina,
+        'conectados': conectados,
+    })
+
+def pagina_pacientes(institucion_id, numero):
+    # Solo las columnas que muestra la plantilla; el filtro usa el índice usuario_inst_rol_activo
+    pacientes = (
+        Usuario.objects.filter(institucion_id=institucion_id, rol=1, is_active=True)  # Asumiendo 1 es el rol de Paciente
+        .order_by('last_name', 'first_name', 'id')
+        .values('id', 'first_name', 'last_name')
+    )
+    pagina = Paginator(pacientes, PACIENTES_POR_PAGINA).get_page(numero)
+    return {
+        'pacientes': list(pagina),
+        'numero': pagina.number,
+        'total_paginas': pagina.paginator.num_pages,
+        'anterior': pagina.previous_page_number() if pagina.has_previous() else None,
+        'siguiente': pagina.next_page_number() if pagina.has_next() else None,
+    }
 
 def chatPaciente(request, paciente_id):
     paciente = get_object_or_404(Usuario, id=paciente_id, rol=1)  # rol=1 para "Paciente"
@@ -170,13 +231,12 @@ def chatPaciente(request, paciente_id):
     # Intenta recuperar la sala, si no existe, créala
     sala, created = Room.objects.get_or_create(terapeuta=request.user, paciente=paciente)
     if created:
-        print(f"Se creó una nueva sala con ID {sala.id}")
-    else:
-        print(f"Se recuperó una sala existente con ID {sala.id}") 
+        logger.info("sala_creada sala=%s terapeuta=%s paciente=%s", sala.id, request.user.pk, paciente.pk)
     context = {
         'sala': sala,
         'paciente': paciente,
         'room_id': sala.id,  # Pasamos la ID de la sala creada o encontrada
+        'paciente_en_sala': paciente.id in presencia.en_sala(sala.id, [paciente.id]),
     }
     return render(request, "terapeuta/chatPaciente.html", context)
 
@@ -189,6 +249,98 @@ def metricasChat(request):
 @terapeuta_required
 def fichaPaciente(request):
     return render(request, "terapeuta/fichaPaciente.html")
+
+PUNTOS_SERIE_POR_DEFECTO = 300
+PUNTOS_SERIE_MAXIMO = 2000
+
+@login_required
+@terapeuta_required
+def serieFrecuenciaCardiaca(request, sesion_id):
+    # Import diferido para no cargar NumPy al iniciar el worker
+    from .series import serie_reducida, METODOS
+
+    sesion = get_object_or_404(SesionTerapia, id=sesion_id)
+
+    # Solo terapeutas de la institución de algún participante de la sesión; sin institución no hay con
+    # qué comparar (None == None daría acceso a las sesiones de cualquier participante sin institución)
+    if request.user.institucion_id is None:
+        raise PermissionDenied
+    participantes = list(UsuarioSesion.objects.filter(sesion=sesion).order_by('id').values_list(
+        'usuario_id', 'rol', 'usuario__institucion_id'
+    ))
+    if not any(institucion_id == request.user.institucion_id for _, _, institucion_id in participantes):
+        raise PermissionDenied
+
+    try:
+        puntos = int(request.GET.get('puntos', PUNTOS_SERIE_POR_DEFECTO))
+        usuario_id = request.GET.get('usuario')
+        usuario_id = int(usuario_id) if usuario_id else None
+    except ValueError:
+        return HttpResponseBadRequest("Parámetros inválidos.")
+
+    # La serie es de una sola persona: por defecto el paciente de la sesión, no todos los participantes
+    if usuario_id is None:
+        usuario_id = next((usuario for usuario, rol, _ in participantes if rol == 1), None)
+        if usuario_id is None:
+            return HttpResponseBadRequest("La sesión no tiene paciente; indique ?usuario=")
+
+    metodo = request.GET.get('metodo', 'minmax')
+    if metodo not in METODOS:
+        return HttpResponseBadRequest(f"Método inválido: {metodo}")
+
+    # El tamaño de la respuesta queda acotado sin importar la duración de la sesión
+    puntos = max(3, min(puntos, PUNTOS_SERIE_MAXIMO))
+
+    return JsonResponse(serie_reducida(sesion.id, usuario_id, puntos, metodo))
+
+# Descargas de signos vitales en CSV (con ?gzip=1 comprimido); se generan por partes mientras se envían
+@login_required
+@terapeuta_required
+def exportarSignosPaciente(request, paciente_id):
+    # Sin institución el filtro institucion_id=None alcanzaría a los pacientes sin institución
+    if request.user.institucion_id is None:
+        raise PermissionDenied
+    paciente = get_object_or_404(
+        Usuario.objects.only('id', 'rut'), id=paciente_id, rol=1, institucion_id=request.user.institucion_id
+    )
+    bloques = SignosVitalesBloque.objects.filter(usuario_id=paciente.id)
+    return respuesta_csv(request, filas_signos_vitales(bloques), ENCABEZADO_SIGNOS_VITALES,
+                         f"signos_vitales_{paciente.rut}")
+
+@login_required
+def exportarSignosInstitucion(request):
+    # El staff puede elegir la institución; terapeutas y administradores descargan la propia
+    if request.user.is_staff and request.GET.get('institucion'):
+        try:
+            institucion_id = int(request.GET['institucion'])
+        except ValueError:
+            return HttpResponseBadRequest("Parámetros inválidos.")
+    elif request.user.rol in (2, 3) and request.user.institucion_id is not None:
+        institucion_id = request.user.institucion_id
+    else:
+        raise PermissionDenied
+
+    bloques = SignosVitalesBloque.objects.filter(usuario__institucion_id=institucion_id)
+    return respuesta_csv(request, filas_signos_vitales(bloques), ENCABEZADO_SIGNOS_VITALES,
+                         f"signos_vitales_institucion_{institucion_id}")
+#----------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------Vistas compartidas entre terapeuta y paciente-------------------------------------
+@login_required
+def historialMensajes(request, room_id):
+    sala = get_object_or_404(Room, id=room_id)
+    if request.user.id not in (sala.terapeuta_id, sala.paciente_id):
+        raise PermissionDenied
+
+    try:
+        limite = int(request.GET.get('limite', settings.HISTORIAL_MENSAJES_CONEXION))
+        antes = request.GET.get('antes')
+        antes = Mensaje.leer_cursor(antes) if antes else None
+    except ValueError:
+        return HttpResponseBadRequest("Parámetros inválidos.")
+
+    limite = max(1, min(limite, settings.HISTORIAL_MENSAJES_PAGINA_MAXIMA))
+    return JsonResponse(Mensaje.objects.pagina(sala.id, limite, antes))
 #----------------------------------------------------------------------------------------------------------------------
 
 #------------------------------------------Vistas específicas para pacientes-------------------------------------------
@@ -201,58 +353,96 @@ def miChat(request):
 
 
 #-------------------------------------Metricas--------------------------------------------------------------------
-class AdminDashboardView(LoginRequiredMixin, TemplateView):
-    template_name = 'core/dashboard.html'
-
+# Segundos que se guarda en caché cada gráfico renderizado (la clave incluye los conteos)
+DURACION_CACHE_GRAFICO = 60 * 60
+
+def metricas_usuarios():
+    if settings.DASHBOARD_CONTADORES_MATERIALIZADOS:
+        contadores = dict(Contador.objects.filter(
+            clave__in=[Contador.USUARIOS_ACTIVOS, Contador.USUARIOS_INACTIVOS]
+        ).values_list('clave', 'valor'))
+        activos = contadores.get(Contador.USUARIOS_ACTIVOS, 0)
+        inactivos = contadores.get(Contador.USUARIOS_INACTIVOS, 0)
+        return {
+            'total_usuarios': activos + inactivos,
+            'usuarios_activos': activos,
+            'usuarios_inactivos': inactivos,
+        }
+
+    # Los tres conteos de usuarios en una sola consulta con agregados condicionales
+    return Usuario.objects.aggregate(
+        total_usuarios=Count('id'),
+        usuarios_activos=Count('id', filter=Q(is_active=True)),
+        usuarios_inactivos=Count('id', filter=Q(is_active=False)),
+    )
+
+def metricas_instituciones():
+    if settings.DASHBOARD_CONTADORES_MATERIALIZADOS:
+        return list(Contador.objects.filter(institucion__isnull=False).values(
+            'institucion_id', nombre=F('institucion__nombre'), num_usuarios=F('valor')
+        ).order_by('-num_usuarios'))
+
+    return list(Institucion.objects.values('id', 'nombre').annotate(
+        num_usuarios=Count('usuario')
+    ).order_by('-num_usuarios'))
+
+def grafico_usuarios_cacheado(usuarios_activos, usuarios_inactivos):
+    clave = f"grafico_usuarios:{usuarios_activos}:{usuarios_inactivos}"
+    png = cache.get(clave)
+    if png is not None:
+        return png
+
+    # Import diferido: matplotlib solo se carga cuando hay que renderizar
+    from .graficos import grafico_usuarios_png
+
+    png = grafico_usuarios_png(usuarios_activos, usuarios_inactivos)
+    cache.set(clave, png, DURACION_CACHE_GRAFICO)
+    return png
+
+class StaffRequiredMixin(LoginRequiredMixin):
     def dispatch(self, request, *args, **kwargs):
         # Solo admins pueden acceder
-        if not request.user.is_staff:
+        if request.user.is_authenticated and not request.user.is_staff:
             return HttpResponseForbidden("No tienes permisos para acceder a esta página.")
         return super().dispatch(request, *args, **kwargs)
 
+class AdminDashboardView(StaffRequiredMixin, TemplateView):
+    template_name = 'core/dashboard.html'
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Obtén las métricas
-        total_usuarios = Usuario.objects.count()
-        usuarios_activos = Usuario.objects.filter(is_active=True).count()
-        usuarios_inactivos = Usuario.objects.filter(is_active=False).count()
-        total_instituciones = Institucion.objects.count()
-
-        # Obtener el número de usuarios por institución y convertir a JSON
-        usuarios_por_institucion = Usuario.objects.values(
-            'institucion__nombre'
-        ).annotate(
-            num_usuarios=Count('institucion')
-        ).order_by('-num_usuarios')
-        
-        # Convertir QuerySet a JSON para el gráfico
-        usuarios_por_institucion_json = json.dumps(list(usuarios_por_institucion))
-
-        # Crear el gráfico de usuarios activos e inactivos
-        fig, ax = plt.subplots()
-        ax.bar(['Activos', 'Inactivos'], [usuarios_activos, usuarios_inactivos], color=['green', 'red'])
-        ax.set_title('Usuarios Activos e Inactivos')
-        ax.set_xlabel('Estado')
-        ax.set_ylabel('Cantidad')
-
-        # Guardar la imagen en formato base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png')
-        buffer.seek(0)
-        graph_img = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        plt.close(fig)
-
-        # Agregar todos los datos al contexto
+        # Obtén las métricas; con DASHBOARD_CONTADORES_MATERIALIZADOS se leen de la tabla Contador
+        metricas = metricas_usuarios()
+
+        # Usuarios por institución; la misma consulta entrega el total de instituciones
+        usuarios_por_institucion = metricas_instituciones()
+
+        # El gráfico se sirve aparte (AdminDashboardGraficoView) para no bloquear el HTML
+        context.update(metricas)
         context.update({
-            'total_usuarios': total_usuarios,
-            'usuarios_activos': usuarios_activos,
-            'usuarios_inactivos': usuarios_inactivos,
-            'total_instituciones': total_instituciones,
-            'graph_img': graph_img,
-            'usuarios_por_institucion_json': usuarios_por_institucion_json
+            'total_instituciones': len(usuarios_por_institucion),
+            'version_grafico': f"{metricas['usuarios_activos']}-{metricas['usuarios_inactivos']}",
+            'usuarios_por_institucion_json': json.dumps(usuarios_por_institucion),
         })
 
         return context
+
+class AdminDashboardGraficoView(StaffRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        metricas = metricas_usuarios()
+        png = grafico_usuarios_cacheado(metricas['usuarios_activos'], metricas['usuarios_inactivos'])
+
+        response = HttpResponse(png, content_type='image/png')
+        # La URL del dashboard cambia con los conteos, así que el navegador puede reutilizar la imagen
+        patch_cache_control(response, private=True, max_age=DURACION_CACHE_GRAFICO)
+        return response
+
+class AdminConexionesView(StaffRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        # Conexiones WebSocket vivas e inactivas del worker que atiende esta petición
+        response = JsonResponse(conexiones.metricas())
+        patch_cache_control(response, no_store=True)
+        return response
 #----------------------------------------fin de las metricas -----------------------------------------------
 
@@ -0,0 +1,29 @@
+# Configuración de la capa de canales (Django Channels) sobre uno o varios servidores Redis.
+
+BACKENDS = {
+    'redis': 'channels_redis.core.RedisChannelLayer',
+    'pubsub': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+}
+
+
+def leer_hosts(valor):
+    """Lista de URLs redis:// separadas por comas (variable REDIS_HOSTS)."""
+    return [host.strip() for host in (valor or '').split(',') if host.strip()]
+
+
+def capa_canales(hosts, tipo='redis', **config):
+    """
+    Entrada de CHANNEL_LAYERS para una lista de shards Redis.
+
+    channels_redis asigna cada grupo (room_<id>) y cada canal a un shard con un hash CRC32
+    de su nombre, de modo que los mensajes de una sala pasan siempre por el mismo servidor.
+    Todos los workers deben recibir la misma lista de hosts en el mismo orden.
+
+    `tipo` es 'redis' (listas en Redis, con capacidad y expiración de grupos) o 'pubsub'
+    (PUBLISH/SUBSCRIBE, menos escrituras por mensaje pero sin entrega a consumidores caídos).
+    """
+    if tipo not in BACKENDS:
+        raise ValueError(f"Capa de canales desconocida: {tipo} (opciones: {', '.join(BACKENDS)})")
+    if not hosts:
+        raise ValueError("La capa de canales necesita al menos un host Redis.")
+    return {'BACKEND': BACKENDS[tipo], 'CONFIG': {'hosts': list(hosts), **config}}
@@ -0,0 +1,51 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class ColaHandler(QueueHandler):
+    """
+    Handler no bloqueante: el registro se formatea en el hilo que lo emite y se encola;
+    un QueueListener en un hilo aparte hace la escritura en stderr. Así el event loop de
+    Daphne nunca espera una syscall de escritura.
+    """
+
+    def __init__(self):
+        cola = queue.SimpleQueue()
+        super().__init__(cola)
+        destino = logging.StreamHandler()
+        # El mensaje ya viene formateado por el formatter de este handler (ver prepare)
+        destino.setFormatter(logging.Formatter('%(message)s'))
+        self.listener = QueueListener(cola, destino)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+
+class MuestreoPorSala(logging.Filter):
+    """
+    Deja pasar uno de cada `cada` registros por (sala, tipo) para los tipos de mensaje de alta
+    frecuencia. Los registros de advertencia o superiores, y los de otros tipos, pasan siempre.
+    Los registros se marcan con extra={'sala': ..., 'tipo': ...}.
+
+    Los contadores son un arreglo fijo de `ranuras` indexado por hash((sala, tipo)): la memoria no
+    crece con las salas que ve un worker de larga vida. Dos salas que caen en la misma ranura
+    comparten el muestreo, lo que solo cambia cuáles de sus registros se conservan.
+    """
+
+    def __init__(self, tipos=(), cada=100, ranuras=1024):
+        super().__init__()
+        self.tipos = set(tipos)
+        self.cada = max(int(cada), 1)
+        self.contadores = [0] * max(int(ranuras), 1)
+
+    def filter(self, record):
+        tipo = getattr(record, 'tipo', None)
+        if tipo not in self.tipos or record.levelno >= logging.WARNING:
+            return True
+        ranura = hash((getattr(record, 'sala', None), tipo)) % len(self.contadores)
+        contador = self.contadores[ranura] + 1
+        if contador >= self.cada:
+            contador = 0
+        self.contadores[ranura] = contador
+        return contador == 1
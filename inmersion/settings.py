@@ -15,6 +15,7 @@ import dj_database_url
 from dotenv import load_dotenv
 import os
 
+from inmersion.canales import capa_canales, leer_hosts
 
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -89,21 +90,82 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'inmersion.asgi.application'
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [
-                {
-                    "host": os.getenv("REDISHOST", "redis.railway.internal"),
-                    "port": int(os.getenv("REDISPORT", 6379)),
-                    "password": os.getenv("REDISPASSWORD", 'XoCOAhIgrEPJApBwphXLceTXCoCgZmUb'), 
-                },
-            ],
-        },
+# REDIS_HOSTS: lista de shards separados por comas (redis://host:puerto/0,redis://...). Las salas
+# se reparten entre ellos por hash del nombre del grupo. Si no se define se usa un único host.
+# CAPA_CANALES: 'redis' (RedisChannelLayer) o 'pubsub' (RedisPubSubChannelLayer).
+REDIS_HOSTS = leer_hosts(os.getenv("REDIS_HOSTS")) or [
+    {
+        "host": os.getenv("REDISHOST", "redis.railway.internal"),
+        "port": int(os.getenv("REDISPORT", 6379)),
+        "password": os.getenv("REDISPASSWORD", 'XoCOAhIgrEPJApBwphXLceTXCoCgZmUb'), 
     },
+]
+
+CHANNEL_LAYERS = {
+    'default': capa_canales(REDIS_HOSTS, os.getenv("CAPA_CANALES", "redis")),
 }
 
+# Caché compartida: Redis si REDIS_URL está definido, si no memoria local del proceso
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+            'KEY_PREFIX': 'inmersion',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# Segundos que cada proceso reutiliza la membresía (terapeuta/paciente) de una sala al conectarse
+MEMBRESIA_SALA_TTL = 60
+
+# Segundos que se conserva el estado de reproducción de una sala sin actividad
+ESTADO_SALA_TTL = 12 * 60 * 60
+
+# Ingesta de signos vitales por WebSocket: tamaño máximo del lote y segundos entre vaciados
+VITALES_LOTE_MAXIMO = int(os.getenv("VITALES_LOTE_MAXIMO", 200))
+VITALES_INTERVALO_VACIADO = float(os.getenv("VITALES_INTERVALO_VACIADO", 2.0))
+# Pulso en vivo para el terapeuta: muestras de la media móvil, salto (bpm) respecto de la media
+# que se descarta como artefacto y segundos entre actualizaciones enviadas a la sala
+VITALES_VENTANA_SUAVIZADO = int(os.getenv("VITALES_VENTANA_SUAVIZADO", 8))
+VITALES_SALTO_MAXIMO = int(os.getenv("VITALES_SALTO_MAXIMO", 30))
+VITALES_INTERVALO_RELEVO = float(os.getenv("VITALES_INTERVALO_RELEVO", 1.0))
+
+# Persistencia diferida de mensajes del chat y acciones de video
+MENSAJES_LOTE_MAXIMO = int(os.getenv("MENSAJES_LOTE_MAXIMO", 50))
+MENSAJES_INTERVALO_VACIADO = float(os.getenv("MENSAJES_INTERVALO_VACIADO", 1.0))
+# Mensajes enviados al conectarse a una sala y tamaño máximo de página del historial
+HISTORIAL_MENSAJES_CONEXION = 50
+HISTORIAL_MENSAJES_PAGINA_MAXIMA = 200
+
+# Límite por conexión WebSocket de las acciones de video (play/pause/seek): acciones por
+# segundo sostenidas y ráfaga máxima permitida. El chat y los signos vitales no se limitan
+WS_TASA_MENSAJES = float(os.getenv("WS_TASA_MENSAJES", 10))
+WS_RAFAGA_MENSAJES = int(os.getenv("WS_RAFAGA_MENSAJES", 20))
+# Ventana (segundos) en la que las ráfagas de seek/play/pause se reducen a su estado final
+VIDEO_VENTANA_COALESCENCIA = float(os.getenv("VIDEO_VENTANA_COALESCENCIA", 0.15))
+# Segundos entre pings del servidor y sin actividad del cliente antes de cerrar la conexión
+WS_INTERVALO_PING = float(os.getenv("WS_INTERVALO_PING", 20))
+WS_TIEMPO_INACTIVIDAD = float(os.getenv("WS_TIEMPO_INACTIVIDAD", 60))
+# Segundos que dura la marca de presencia de un usuario sin renovarla (se renueva en cada ping)
+PRESENCIA_TTL = int(WS_INTERVALO_PING * 2 + 5)
+
+# Umbrales (bpm) de las zonas de frecuencia cardíaca del resumen de sesión y
+# hueco máximo (segundos) entre muestras que todavía cuenta como tiempo en zona
+# (y que no vacía la ventana de elevación sostenida de las alertas)
+VITALES_UMBRAL_ELEVADO = 100
+VITALES_UMBRAL_ALTO = 120
+VITALES_BRECHA_MAXIMA = 5.0
+
+# Si es True el dashboard lee contadores mantenidos por señales (tabla Contador) en vez de
+# contar usuarios en cada visita. Al activarlo ejecutar `manage.py recalcular_contadores`.
+DASHBOARD_CONTADORES_MATERIALIZADOS = os.getenv("DASHBOARD_CONTADORES_MATERIALIZADOS", "False") == "True"
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -121,8 +183,6 @@ CHANNEL_LAYERS = {
  #   }
 #}
 
-print("DATABASE_URL:", os.getenv("DATABASE_URL"))
-
 DATABASES = {
     'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
 }
@@ -183,3 +243,49 @@ STORAGES = {
 #VARIABLE DE REDIRECCION DE LOGIN Y LOGOUT
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "home"
+
+# Logging
+# Todo pasa por una cola (inmersion.registro.ColaHandler) y se escribe desde un hilo aparte,
+# para que los consumers no bloqueen el event loop con escrituras a stdout/stderr.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'estructurado': {
+            'format': '%(asctime)s level=%(levelname)s logger=%(name)s %(message)s',
+        },
+    },
+    'filters': {
+        # Mensajes de alta frecuencia: solo se registra 1 de cada 100 por sala
+        'muestreo_sala': {
+            '()': 'inmersion.registro.MuestreoPorSala',
+            'tipos': ['vitals', 'seek'],
+            'cada': 100,
+        },
+    },
+    'handlers': {
+        'cola': {
+            '()': 'inmersion.registro.ColaHandler',
+            'formatter': 'estructurado',
+            'filters': ['muestreo_sala'],
+        },
+    },
+    'root': {
+        'handlers': ['cola'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['cola'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core': {
+            'handlers': ['cola'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
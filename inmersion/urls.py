@@ -20,10 +20,11 @@ from django.contrib import admin
 from core.views import (
     home, exit, register,
     institucion, CustomLoginView,
-    UsuarioUpdateView, buscarUsuario,
+    UsuarioUpdateView, buscarUsuario, autocompletarUsuarios,
     listarPacientes, chatPaciente, miChat,
-    AdminDashboardView, metricasChat,
-    fichaPaciente,
+    AdminDashboardView, AdminDashboardGraficoView, AdminConexionesView, metricasChat,
+    fichaPaciente, serieFrecuenciaCardiaca,
+    historialMensajes, exportarSignosPaciente, exportarSignosInstitucion,
 )
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -34,11 +35,18 @@ urlpatterns = [
     path('login/', CustomLoginView.as_view(), name='login'),
     path('usuario/<int:pk>/editar/', UsuarioUpdateView.as_view(), name='editarUsuario'),
     path('buscadorUsuario/', buscarUsuario, name='buscadorUsuario'),
+    path('usuarios/autocompletar/', autocompletarUsuarios, name='autocompletarUsuarios'),
     path('pacientes/', listarPacientes, name='listarPacientes'),
     path('terapeuta/chat/<int:paciente_id>/', chatPaciente, name='chatPaciente'),
     path('paciente/chat/', miChat, name='miChat'),
+    path('sala/<int:room_id>/mensajes/', historialMensajes, name='historialMensajes'),
     path('dashboard/', AdminDashboardView.as_view(), name='dashboard'),
+    path('dashboard/grafico.png', AdminDashboardGraficoView.as_view(), name='dashboardGrafico'),
+    path('dashboard/conexiones/', AdminConexionesView.as_view(), name='dashboardConexiones'),
     path('terapeuta/metricasChat', metricasChat, name='metricasChat'),
     path('terapeuta/fichaPaciente', fichaPaciente, name='fichaPaciente'),
+    path('terapeuta/sesion/<int:sesion_id>/frecuencia/', serieFrecuenciaCardiaca, name='serieFrecuenciaCardiaca'),
+    path('terapeuta/paciente/<int:paciente_id>/signos.csv', exportarSignosPaciente, name='exportarSignosPaciente'),
+    path('institucion/signos.csv', exportarSignosInstitucion, name='exportarSignosInstitucion'),
     
 ]